@@ -19,6 +19,19 @@
 
 import re
 import logging
+import operator
+import threading
+import collections
+import time
+import copy
+import heapq
+import numbers
+
+try:
+    import numpy
+    _numpy_available = True
+except:
+    _numpy_available = False
 
 _LOGGER = logging.getLogger("[EVAL]")
 _LOGGER.level = logging.INFO
@@ -49,6 +62,14 @@ def TypedDict2Str(d):
     return retval
 
 class TypedClass(object):
+    '''
+    A value with its type. The instances have no __dict__ (to reduce the memory needed to hold the
+      keywords of many hosts) and some values are shared instances (the booleans, the small numbers
+      obtained from strings and the empty lists in the expressions), so they must not be modified
+      in place unless their type is UNKNOWN.
+    '''
+    __slots__ = ('value', 'type')
+
     UNKNOWN = -1
     STRING = 0
     NUMBER = 1
@@ -71,26 +92,27 @@ class TypedClass(object):
                 v = e
             else:
                 v = f
+            if type(v) is int and 0 <= v < len(_SMALL_NUMBERS):
+                return _SMALL_NUMBERS[v]
             return TypedClass(v, TypedClass.NUMBER)
         except ValueError:
             if len(v)>2 and v[0]=='[' and v[-1]==']':
                 l_contents = ",%s" % v[1:-1]
                 l_items = []
-                expr = re.compile("^,(?P<value>(\"(\\.|[^\"])*\"|[^,]*)*)")
-                result = expr.search(l_contents)
-                
+                # The items are matched one after the other from the position where the previous one
+                #   ended, instead of slicing the string (which is quadratic in its length)
+                result = _LIST_ITEM_EXPR.match(l_contents)
                 while result is not None:
                     l_items.append(TypedClass.auto(result.group('value')))
-                    l_contents = l_contents[result.end():]
-                    result = expr.search(l_contents)
+                    result = _LIST_ITEM_EXPR.match(l_contents, result.end())
                     
                 return TypedList(l_items)
 
             b = str(v).lower()
             if b == 'true':
-                return TypedClass(True, TypedClass.BOOLEAN)
+                return _TRUE
             elif b == 'false':
-                return TypedClass(False, TypedClass.BOOLEAN)
+                return _FALSE
 
             return TypedClass(str(v), TypedClass.STRING)
     
@@ -115,6 +137,8 @@ class TypedClass(object):
         return v.value == self.value
 
 class TypedList(TypedClass):
+    __slots__ = ()
+
     def __init__(self, v):
         TypedClass.__init__(self, v, TypedClass.LIST)
 
@@ -135,6 +159,8 @@ class TypedList(TypedClass):
         return "%s (tipo %s) " % (str(self.value), self.type)
     
 class TypedNumber(TypedClass):
+    __slots__ = ()
+
     def __init__(self, v):
         try:
             f = float(v)
@@ -150,19 +176,50 @@ class TypedNumber(TypedClass):
         except ValueError:
             TypedClass.__init__(self, str(v), TypedClass.STRING)
 
-def vars_from_string(s):
-    variables = {}
+_TRUE = TypedClass(True, TypedClass.BOOLEAN)
+_FALSE = TypedClass(False, TypedClass.BOOLEAN)
+_SMALL_NUMBERS = [ TypedClass(n, TypedClass.NUMBER) for n in range(1025) ]
+
+_LIST_ITEM_EXPR = re.compile(",(?P<value>(\"(\\.|[^\"])*\"|[^,]*)*)")
+_KEYWORD_EXPR = re.compile(r';(?P<key>[a-zA-Z][a-zA-Z_0-9]*)=(?P<value>(\"(\\.|[^\"])*\"|[^;]*)*)')
+
+def _scan_keywords(s):
+    # Yields the pairs (key, value) in a string of keywords in a single pass: each keyword is matched
+    #   from the position where the previous one ended. It raises ErrorInExpression if the string
+    #   is not completely consumed.
     s=";%s" % s.strip().strip(";")
-    expr = re.compile(r'^;(?P<key>[a-zA-Z][a-zA-Z_0-9]*)=(?P<value>(\"(\\.|[^\"])*\"|[^;]*)*)')
-    result = expr.search(s)
+    pos = 0
+    result = _KEYWORD_EXPR.match(s)
     while result is not None:
-        variables[result.group('key')]=TypedClass.auto(result.group('value'))
-        s = s[result.end():]
-        result = expr.search(s)
-    if len(s)>0:
+        yield (result.group('key'), result.group('value'))
+        pos = result.end()
+        result = _KEYWORD_EXPR.match(s, pos)
+    if pos < len(s):
         raise ErrorInExpression()
+
+def vars_from_string(s):
+    variables = {}
+    for key, value in _scan_keywords(s):
+        variables[key]=TypedClass.auto(value)
     return variables
 
+def vars_from_strings(strings):
+    # Parses many strings of keywords (e.g. one for each node) and returns the list of dictionaries.
+    #   The typed values are shared between the dictionaries of the nodes that have the same value
+    #   for a keyword (e.g. the list of queues), so they must not be modified.
+    values = {}
+    retval = []
+    for s in strings:
+        variables = {}
+        for key, value in _scan_keywords(s):
+            typed = values.get(value)
+            if typed is None:
+                typed = TypedClass.auto(value)
+                values[value] = typed
+            variables[key] = typed
+        retval.append(variables)
+    return retval
+
 def vars_from_string_(s):
     s=s.strip()
     while len(s) > 0:
@@ -199,33 +256,1698 @@ def vars_from_string_(s):
         s = rest    
 
 
-class Analyzer:
-    def __init__(self, autodefinevars = True, **kwargs):
-        import ply.lex as lex
-        import ply.yacc as yacc
-        self.lexer = lex.lex(module=self, debug=0, optimize=1, **kwargs)
-        self.yacc = yacc.yacc(module=self, debug=0, optimize=1)
-        self._VAR_VALUES = {}
-        self._autodefine_vars = autodefinevars
-        self._current_expr = ""
+def _init_vars(v1, v2):
+    # If one of the values has not a type yet (i.e. it is a var that has been defined on the fly), it
+    #   takes the type of the other value and the default value for that type.
+    if v1.type == TypedClass.UNKNOWN:
+        if v2.type == TypedClass.LIST:
+            v1.value = []
+        elif v2.type == TypedClass.BOOLEAN:
+            v1.value = False
+        elif v2.type == TypedClass.NUMBER:
+            v1.value = 0
+        elif v2.type == TypedClass.STRING:
+            v1.value = ""
+        else:
+            v1.value = None
+        v1.type = v2.type
+
+    if v2.type == TypedClass.UNKNOWN:
+        if v1.type == TypedClass.LIST:
+            v2.value = []
+        elif v1.type == TypedClass.BOOLEAN:
+            v2.value = False
+        elif v1.type == TypedClass.NUMBER:
+            v2.value = 0
+        elif v1.type == TypedClass.STRING:
+            v2.value = ""
+        else:
+            v2.value = None
+        v2.type = v1.type
+
+def _is_true(v):
+    # Whether a result of an evaluation means that the expression is fulfilled
+    return v is not None and v.type == TypedClass.BOOLEAN and bool(v.value)
+
+class _NotVectorizable(Exception): pass
+
+def _int_bound(v):
+    # Returns the maximum absolute value of v (a NumPy array or a scalar) if it holds integers, or None
+    if isinstance(v, numpy.ndarray):
+        if v.dtype.kind not in 'iu':
+            return None
+        if len(v) == 0:
+            return 0
+        return max(abs(int(v.max())), abs(int(v.min())))
+    if isinstance(v, numbers.Integral):
+        return abs(int(v))
+    return None
+
+def _check_numbers(op, v1, v2):
+    # Raises _NotVectorizable if NumPy could obtain a different result than python for the operation
+    #   with these numbers: the int64 arithmetic overflows silently (python ints are unbounded) and
+    #   the integers are converted to float64 when they are compared or divided (python is exact)
+    b1 = _int_bound(v1)
+    b2 = _int_bound(v2)
+    if (b1 is not None) and (b2 is not None):
+        if op in [ '+', '-' ]:
+            exact = b1 + b2 < 2 ** 63
+        elif op == '*':
+            exact = b1 * b2 < 2 ** 63
+        elif op == '/':
+            exact = max(b1, b2) <= 2 ** 53
+        else:
+            exact = max(b1, b2) < 2 ** 63
+        if not exact:
+            raise _NotVectorizable()
+    elif op not in [ '+', '-', '*' ]:
+        bound = b1 if b1 is not None else b2
+        if (bound is not None) and (bound > 2 ** 53):
+            raise _NotVectorizable()
+
+class ColumnarTable(object):
+    '''
+    This class arranges the keywords of many hosts (e.g. the results of vars_from_string for each of
+      them) as columns, one array per keyword, so that an expression can be evaluated for all the
+      hosts at once by using NumPy. A keyword can only be used as a column if every host has it and
+      all the values have the same type (number, string or boolean); the columns are built on demand.
+    '''
+    def __init__(self, vars_list):
+        self.rows = list(vars_list)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, name):
+        # Returns a tuple (type, array) for the keyword, or None if it cannot be used as a column
+        if name not in self._columns:
+            self._columns[name] = self._build_column(name)
+        return self._columns[name]
+
+    def _build_column(self, name):
+        if not _numpy_available or len(self.rows) == 0:
+            return None
+        _type = None
+        values = []
+        for _vars in self.rows:
+            v = _vars.get(name)
+            if v is None:
+                return None
+            if _type is None:
+                _type = v.type
+            if v.type != _type or _type not in [ TypedClass.NUMBER, TypedClass.STRING, TypedClass.BOOLEAN ]:
+                return None
+            values.append(v.value)
+        values = numpy.array(values)
+        if values.dtype == object:
+            # e.g. integers that do not fit in int64
+            return None
+        return (_type, values)
+
+class _Scope(object):
+    '''
+    The set of variables that is seen by one evaluation of a compiled expression. The variables are
+      read from _vars and the new ones (assignments and vars that are defined on the fly) are stored
+      in a local dictionary, so that the dictionary of the caller is not modified unless inplace
+      is set to True (which is what the Analyzer does with its own variables).
+    '''
+    def __init__(self, _vars, autodefine = True, inplace = False):
+        self._vars = _vars
+        self._local = None
+        self._inplace = inplace
+        self.autodefine = autodefine
+
+    def lookup(self, name):
+        if self._local is not None:
+            v = self._local.get(name)
+            if v is not None:
+                return v
+        return self._vars.get(name)
+
+    def define(self, name, value):
+        if self._inplace:
+            self._vars[name] = value
+        else:
+            if self._local is None:
+                self._local = {}
+            self._local[name] = value
+
+def _literal_str(v):
+    if v.type == TypedClass.STRING:
+        return "\"%s\"" % v.value
+    if v.type == TypedClass.BOOLEAN:
+        return str(v.value).lower()
+    if v.type == TypedClass.LIST:
+        return "[%s]" % ", ".join([ _literal_str(item) for item in v.value ])
+    return str(v.value)
+
+def _produces_boolean(node):
+    # Whether the node always produces a boolean value (if it does not raise an error)
+    if isinstance(node, _Literal):
+        return node.value.type == TypedClass.BOOLEAN
+    if isinstance(node, (_Not, _In, _Subset)):
+        return True
+    if isinstance(node, _Compare):
+        if node.op in [ '&&', '||' ]:
+            return _produces_boolean(node.left) and _produces_boolean(node.right)
+        return node._f is not None
+    return False
+
+class _Node(object):
+    '''
+    This is the base class for the nodes of the tree that the Analyzer builds when it parses one
+      expression. Evaluating the tree obtains the same result (and raises the same exceptions) than
+      the old approach of computing the values during the parsing.
+    '''
+    def evaluate(self, scope):
+        raise NotImplementedError()
+
+    # Whether the node can be replaced by its value when all its children are literals
+    _foldable = False
+
+    def children(self):
+        return []
+
+    def with_children(self, children):
+        # Returns a node like this one, but with other children
+        return self
+
+    def partial(self, fixed, autodefine):
+        # Returns the node that results from replacing the vars in the dictionary fixed by their
+        #   values and folding the sub-trees that only depend on literals.
+        children = [ child.partial(fixed, autodefine) for child in self.children() ]
+        node = self.with_children(children)
+        if self._foldable and all([ isinstance(child, _Literal) for child in children ]):
+            try:
+                v = node.evaluate(_Scope({}, autodefine))
+            except Exception:
+                # The error will be raised when evaluating the expression
+                return node
+            if v is not None and v.type != TypedClass.UNKNOWN:
+                return _Literal(v)
+        return node
+
+    def lazy(self, reorder):
+        # Returns the node in which the && and || operators are evaluated lazily (see _LazyBoolOp)
+        children = self.children()
+        if len(children) == 0:
+            return self
+        return self.with_children([ child.lazy(reorder) for child in children ])
+
+    def walk(self):
+        # Yields this node and all the nodes below it
+        yield self
+        for child in self.children():
+            for node in child.walk():
+                yield node
+
+    def vectorize(self, table):
+        # Evaluates the node for all the rows in a ColumnarTable at once and returns a tuple (type,
+        #   values) where values is either a scalar or a NumPy array. It raises _NotVectorizable if
+        #   the node cannot be evaluated in that way (or it would raise an error).
+        raise _NotVectorizable()
+
+class _Literal(_Node):
+    def __init__(self, value):
+        self.value = value
+
+    def evaluate(self, scope):
+        return self.value
 
-    def check(self, expr):
-        self._current_expr = expr
-        return self.yacc.parse(expr, debug=0, lexer=self.lexer)
+    def vectorize(self, table):
+        if self.value.type == TypedClass.LIST:
+            raise _NotVectorizable()
+        return (self.value.type, self.value.value)
 
-    def clear_vars(self):
-        self._VAR_VALUES = {}
+    def __str__(self):
+        return _literal_str(self.value)
 
-    def get_vars(self):
-        return self._VAR_VALUES
+class _Empty(_Node):
+    def evaluate(self, scope):
+        # A new value is needed in each evaluation because _init_vars may change its type
+        return TypedClass(None, TypedClass.UNKNOWN)
 
-    def add_vars(self, _vars, clear = False):
-        if clear:
-            self.clear_vars()
-            
+    def __str__(self):
+        return ""
+
+class _Var(_Node):
+    def __init__(self, name):
+        self.name = name
+
+    def evaluate(self, scope):
+        v = scope.lookup(self.name)
+        if v is None:
+            if not scope.autodefine:
+                raise UndefinedVar()
+            v = TypedClass(None, TypedClass.UNKNOWN)
+            scope.define(self.name, v)
+        return v
+
+    def partial(self, fixed, autodefine):
+        # The fixed vars are replaced whatever their type (also if it is unknown), so that the result is
+        #   the same than evaluating the expression with the fixed vars
+        v = fixed.get(self.name)
+        if v is None:
+            return self
+        return _Literal(v)
+
+    def vectorize(self, table):
+        column = table.column(self.name)
+        if column is None:
+            raise _NotVectorizable()
+        return column
+
+    def __str__(self):
+        return self.name
+
+class _ListVar(_Var):
+    '''
+    A var that is used as the right operand of IN or SUBSET, so it must be a list
+    '''
+    def __init__(self, name, error_msg):
+        _Var.__init__(self, name)
+        self.error_msg = error_msg
+
+    def evaluate(self, scope):
+        l = scope.lookup(self.name)
+        if l is None:
+            if not scope.autodefine:
+                raise TypeError(self.error_msg)
+            # a new list is needed because the vars are visible (and so modifiable) by the caller
+            l = TypedList([])
+            scope.define(self.name, l)
+        if l.type != TypedClass.LIST: raise TypeError(self.error_msg)
+        return l
+
+    def vectorize(self, table):
+        raise _NotVectorizable()
+
+class _ListExpr(_Node):
+    def __init__(self, items):
+        self.items = items
+
+    def evaluate(self, scope):
+        return TypedList([ item.evaluate(scope) for item in self.items ])
+
+    _foldable = True
+
+    def children(self):
+        return self.items
+
+    def with_children(self, children):
+        return _ListExpr(children)
+
+    def __str__(self):
+        return "[%s]" % ", ".join([ str(item) for item in self.items ])
+
+class _Assign(_Node):
+    def __init__(self, name, expression):
+        self.name = name
+        self.expression = expression
+
+    def evaluate(self, scope):
+        scope.define(self.name, self.expression.evaluate(scope))
+        return None
+
+    def children(self):
+        return [ self.expression ]
+
+    def with_children(self, children):
+        return _Assign(self.name, children[0])
+
+    def __str__(self):
+        return "%s = %s" % (self.name, self.expression)
+
+class _Sequence(_Node):
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    def evaluate(self, scope):
+        v1 = self.first.evaluate(scope)
+        v2 = self.second.evaluate(scope)
+        if v2 is not None:
+            return v2
+        if v1 is not None:
+            return v1
+        return TypedClass(None, TypedClass.UNKNOWN)
+
+    def children(self):
+        return [ self.first, self.second ]
+
+    def with_children(self, children):
+        return _Sequence(children[0], children[1])
+
+    def __str__(self):
+        return "%s; %s" % (self.first, self.second)
+
+class _Not(_Node):
+    def __init__(self, expression):
+        self.expression = expression
+
+    def evaluate(self, scope):
+        v = self.expression.evaluate(scope)
+        if v.type == TypedClass.BOOLEAN:
+            return _FALSE if v.value else _TRUE
+        raise TypeError("operator invalid for this type")
+
+    def vectorize(self, table):
+        (_type, v) = self.expression.vectorize(table)
+        if _type != TypedClass.BOOLEAN:
+            raise _NotVectorizable()
+        return (TypedClass.BOOLEAN, numpy.logical_not(v))
+
+    _foldable = True
+
+    def children(self):
+        return [ self.expression ]
+
+    def with_children(self, children):
+        return _Not(children[0])
+
+    def __str__(self):
+        return "!(%s)" % self.expression
+
+class _Negate(_Node):
+    def __init__(self, expression):
+        self.expression = expression
+
+    def evaluate(self, scope):
+        v = self.expression.evaluate(scope)
+        if v.type == TypedClass.NUMBER:
+            return TypedClass(-v.value, TypedClass.NUMBER)
+        raise TypeError("operator invalid for this type")
+
+    def vectorize(self, table):
+        (_type, v) = self.expression.vectorize(table)
+        if _type != TypedClass.NUMBER:
+            raise _NotVectorizable()
+        _check_numbers('-', 0, v)
+        return (TypedClass.NUMBER, numpy.negative(v))
+
+    _foldable = True
+
+    def children(self):
+        return [ self.expression ]
+
+    def with_children(self, children):
+        return _Negate(children[0])
+
+    def __str__(self):
+        return "-(%s)" % self.expression
+
+class _BinaryNode(_Node):
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+    _foldable = True
+
+    def children(self):
+        return [ self.left, self.right ]
+
+    def with_children(self, children):
+        return self.__class__(self.op, children[0], children[1])
+
+    def __str__(self):
+        return "(%s %s %s)" % (self.left, self.op, self.right)
+
+def _and(a, b):
+    return a and b
+
+def _or(a, b):
+    return a or b
+
+class _Compare(_BinaryNode):
+    '''
+    The comparison operators and the boolean operators && and ||
+    '''
+    OPERATORS = {
+        '>': operator.gt,
+        '<': operator.lt,
+        '>=': operator.ge,
+        '<=': operator.le,
+        '==': operator.eq,
+        '!=': operator.ne,
+        '&&': _and,
+        '||': _or,
+    }
+
+    def __init__(self, op, left, right):
+        _BinaryNode.__init__(self, op, left, right)
+        # The words "and" and "or" are accepted by the grammar, but they have never produced a value
+        self._f = self.OPERATORS.get(op)
+        self._string_op = op in [ '==', '!=' ]
+        # && and || keep the value of their operands, the comparisons produce True or False
+        self._bool_result = op not in [ '&&', '||' ]
+
+    def evaluate(self, scope):
+        v1 = self.left.evaluate(scope)
+        v2 = self.right.evaluate(scope)
+        if scope.autodefine:
+            _init_vars(v1, v2)
+
+        if v1.type != v2.type: raise TypeError()
+
+        if v1.type == TypedClass.LIST:
+            raise TypeError("operator not defined for lists")
+        if v1.type == TypedClass.STRING and not self._string_op:
+            raise TypeError("operator not defined for strings")
+
+        if self._f is None:
+            return None
+        if self._bool_result:
+            return _TRUE if self._f(v1.value, v2.value) else _FALSE
+        return TypedClass(self._f(v1.value, v2.value), TypedClass.BOOLEAN)
+
+    def lazy(self, reorder):
+        if self.op not in [ '&&', '||' ]:
+            return _BinaryNode.lazy(self, reorder)
+
+        # The chains of the same operator are flattened in a single node
+        operands = []
+        pending = [ self ]
+        while len(pending) > 0:
+            node = pending.pop(0)
+            if isinstance(node, _Compare) and node.op == self.op:
+                pending = [ node.left, node.right ] + pending
+            else:
+                operands.append(node.lazy(reorder))
+        return _LazyBoolOp(self.op, operands, reorder)
+
+    def partial(self, fixed, autodefine):
+        node = _BinaryNode.partial(self, fixed, autodefine)
+        if not isinstance(node, _Compare) or node.op not in [ '&&', '||' ]:
+            return node
+
+        # If one of the operands is a boolean constant and the other one is also a boolean, the
+        #   expression is simplified. When the constant decides the result (false && x, true || x)
+        #   the other operand is dropped, and so the errors that it could raise.
+        for constant, other in [ (node.left, node.right), (node.right, node.left) ]:
+            if isinstance(constant, _Literal) and constant.value.type == TypedClass.BOOLEAN and _produces_boolean(other):
+                if constant.value.value == (node.op == '||'):
+                    return constant
+                return other
+        return node
+
+    def vectorize(self, table):
+        (t1, v1) = self.left.vectorize(table)
+        (t2, v2) = self.right.vectorize(table)
+        if t1 != t2 or self._f is None:
+            raise _NotVectorizable()
+        if self.op in [ '&&', '||' ]:
+            # Only the booleans are vectorized, because "and" and "or" keep the value of the numbers
+            if t1 != TypedClass.BOOLEAN:
+                raise _NotVectorizable()
+            if self.op == '&&':
+                return (TypedClass.BOOLEAN, numpy.logical_and(v1, v2))
+            return (TypedClass.BOOLEAN, numpy.logical_or(v1, v2))
+        if t1 == TypedClass.STRING and not self._string_op:
+            raise _NotVectorizable()
+        if t1 == TypedClass.NUMBER:
+            _check_numbers(self.op, v1, v2)
+        return (TypedClass.BOOLEAN, self._f(v1, v2))
+
+class _BinOp(_BinaryNode):
+    '''
+    The arithmetic operators
+    '''
+    OPERATORS = {
+        '+': operator.add,
+        '-': operator.sub,
+        '*': operator.mul,
+        # the plain / keeps the division of python (integer division in Python 2), as the native code
+        '/': lambda a, b: a / b,
+    }
+
+    def __init__(self, op, left, right):
+        _BinaryNode.__init__(self, op, left, right)
+        self._f = self.OPERATORS[op]
+
+    def evaluate(self, scope):
+        v1 = self.left.evaluate(scope)
+        v2 = self.right.evaluate(scope)
+        if scope.autodefine:
+            _init_vars(v1, v2)
+
+        if v1.type != v2.type: raise TypeError()
+
+        if v1.type == TypedClass.LIST:
+            if self.op == '+':
+                return TypedList(v1.value + v2.value)
+            raise TypeError('operator not defined for lists')
+        if v1.type == TypedClass.STRING:
+            if self.op == '+':
+                return TypedClass(v1.value + v2.value, TypedClass.STRING)
+            raise TypeError('operator not defined for strings')
+        if v1.type == TypedClass.NUMBER:
+            return TypedClass(self._f(v1.value, v2.value), TypedClass.NUMBER)
+        raise TypeError("operator invalid for this type")
+
+    def vectorize(self, table):
+        (t1, v1) = self.left.vectorize(table)
+        (t2, v2) = self.right.vectorize(table)
+        if t1 != TypedClass.NUMBER or t2 != TypedClass.NUMBER:
+            raise _NotVectorizable()
+        if self.op == '/' and numpy.any(numpy.asarray(v2) == 0):
+            # The scalar path raises ZeroDivisionError for these rows
+            raise _NotVectorizable()
+        _check_numbers(self.op, v1, v2)
+        return (TypedClass.NUMBER, self._f(v1, v2))
+
+class _In(_BinaryNode):
+    def __init__(self, left, right):
+        _BinaryNode.__init__(self, 'in', left, right)
+
+    def with_children(self, children):
+        return _In(children[0], children[1])
+
+    def evaluate(self, scope):
+        v = self.left.evaluate(scope)
+        l = self.right.evaluate(scope)
+        if l.type != TypedClass.LIST: raise TypeError("expected list for IN operator")
+
+        for item in l.value:
+            if v == item:
+                return _TRUE
+        return _FALSE
+
+class _Subset(_BinaryNode):
+    def __init__(self, left, right):
+        _BinaryNode.__init__(self, 'subset', left, right)
+
+    def with_children(self, children):
+        return _Subset(children[0], children[1])
+
+    def evaluate(self, scope):
+        l1 = self.left.evaluate(scope)
+        l2 = self.right.evaluate(scope)
+        if l1.type != TypedClass.LIST: raise TypeError("lists expected for SUBSET operator")
+        if l2.type != TypedClass.LIST: raise TypeError("lists expected for SUBSET operator")
+
+        for vl in l1.value:
+            found = False
+            for vr in l2.value:
+                if vl == vr:
+                    found = True
+                    break
+            if not found:
+                return _FALSE
+        return _TRUE
+
+class _LazyOperand(object):
+    def __init__(self, node, index):
+        self.node = node
+        self.index = index
+        self.evaluations = 0
+        self.decisive = 0
+        self.samples = 0
+        self.elapsed = 0.0
+
+    def rank(self):
+        # The expected cost of evaluating the operand per evaluation that decides the result, so
+        #   the cheap operands that usually decide the result are evaluated first.
+        if self.samples == 0 or self.evaluations == 0:
+            return None
+        return (self.elapsed / self.samples) / max(float(self.decisive) / self.evaluations, 0.001)
+
+class _LazyBoolOp(_Node):
+    '''
+    This node evaluates a chain of && (or ||) operators lazily: the operands are evaluated in order
+      and the evaluation stops as soon as one of them decides the result. If reorder is True, the
+      operands are periodically reordered according to their measured cost and the ratio of times
+      that they decide the result. The operands must be booleans (a var defined on the fly is
+      taken as false); otherwise a TypeError is raised.
+    An operand that raises an error does not decide the result: the rest of the operands are
+      evaluated and the error is only raised if none of them decides the result (the error of the
+      first operand in the expression, if several ones fail). In this way the result does not
+      depend on the order in which the operands are evaluated.
+    '''
+    REORDER_PERIOD = 1024
+    SAMPLE_PERIOD = 16
+
+    def __init__(self, op, operands, reorder = True):
+        self.op = op
+        self._decisive = (op == '||')
+        self._operands = [ _LazyOperand(node, index) for (index, node) in enumerate(operands) ]
+        self._reorder = reorder
+        self._calls = 0
+
+    def evaluate(self, scope):
+        self._calls += 1
+        if self._reorder and self._calls % self.REORDER_PERIOD == 0:
+            self.reorder()
+        sample = self._reorder and self._calls % self.SAMPLE_PERIOD == 0
+
+        error = None
+        for operand in self._operands:
+            operand.evaluations += 1
+            try:
+                if sample:
+                    t0 = time.time()
+                    v = operand.node.evaluate(scope)
+                    operand.elapsed += time.time() - t0
+                    operand.samples += 1
+                else:
+                    v = operand.node.evaluate(scope)
+
+                if v.type != TypedClass.BOOLEAN:
+                    if v.type == TypedClass.UNKNOWN and scope.autodefine:
+                        _init_vars(v, _FALSE)
+                    else:
+                        raise TypeError()
+            except Exception as e:
+                if (error is None) or (operand.index < error[0]):
+                    error = (operand.index, e)
+                continue
+            if bool(v.value) == self._decisive:
+                operand.decisive += 1
+                return _TRUE if self._decisive else _FALSE
+        if error is not None:
+            raise error[1]
+        return _FALSE if self._decisive else _TRUE
+
+    def reorder(self):
+        # Sorts the operands by their rank; the operands without measures keep their position at the end
+        operands = list(self._operands)
+        measured = [ o for o in operands if o.rank() is not None ]
+        unmeasured = [ o for o in operands if o.rank() is None ]
+        measured.sort(key = lambda o: o.rank())
+        self._operands = measured + unmeasured
+
+    def children(self):
+        # The operands in the order of the expression
+        return [ operand.node for operand in sorted(self._operands, key = lambda o: o.index) ]
+
+    def with_children(self, children):
+        return _LazyBoolOp(self.op, children, self._reorder)
+
+    def __str__(self):
+        return "(%s)" % (" %s " % self.op).join([ str(child) for child in self.children() ])
+
+
+class _CodeGenerator(object):
+    '''
+    This class translates a tree of nodes into the source code of a Python function that evaluates
+      it, with the same type checks, errors and side effects than evaluating the tree.
+    '''
+    _PYTHON_OPERATORS = { '>': '>', '<': '<', '>=': '>=', '<=': '<=', '==': '==', '!=': '!=', '&&': 'and', '||': 'or', '+': '+', '-': '-', '*': '*', '/': '/' }
+
+    def __init__(self):
+        self._lines = []
+        self._count = 0
+        self.namespace = {
+            'TypedClass': TypedClass,
+            'TypedList': TypedList,
+            'UndefinedVar': UndefinedVar,
+            '_init_vars': _init_vars,
+            '_TRUE': _TRUE,
+            '_FALSE': _FALSE,
+        }
+
+    def _name(self, prefix = "v"):
+        self._count += 1
+        return "%s%d" % (prefix, self._count)
+
+    def _line(self, indent, line):
+        self._lines.append("%s%s" % ("    " * indent, line))
+
+    def generate(self, tree):
+        self._line(0, "def _evaluate(scope):")
+        self._line(1, "lookup = scope.lookup")
+        self._line(1, "define = scope.define")
+        self._line(1, "autodefine = scope.autodefine")
+        result = self.emit(tree, 1)
+        self._line(1, "return %s" % result)
+        return "\n".join(self._lines) + "\n"
+
+    def emit(self, node, indent):
+        # Emits the code that evaluates the node and returns the name of the variable that holds the result
+        return getattr(self, "_emit%s" % node.__class__.__name__)(node, indent)
+
+    def _emit_Native(self, node, indent):
+        return self.emit(node.tree, indent)
+
+    def _emit_Literal(self, node, indent):
+        name = self._name("k")
+        self.namespace[name] = node.value
+        return name
+
+    def _emit_Empty(self, node, indent):
+        name = self._name()
+        self._line(indent, "%s = TypedClass(None, %d)" % (name, TypedClass.UNKNOWN))
+        return name
+
+    def _emit_Var(self, node, indent):
+        name = self._name()
+        self._line(indent, "%s = lookup(%r)" % (name, node.name))
+        self._line(indent, "if %s is None:" % name)
+        self._line(indent + 1, "if not autodefine: raise UndefinedVar()")
+        self._line(indent + 1, "%s = TypedClass(None, %d)" % (name, TypedClass.UNKNOWN))
+        self._line(indent + 1, "define(%r, %s)" % (node.name, name))
+        return name
+
+    def _emit_ListVar(self, node, indent):
+        name = self._name()
+        self._line(indent, "%s = lookup(%r)" % (name, node.name))
+        self._line(indent, "if %s is None:" % name)
+        self._line(indent + 1, "if not autodefine: raise TypeError(%r)" % node.error_msg)
+        self._line(indent + 1, "%s = TypedList([])" % name)
+        self._line(indent + 1, "define(%r, %s)" % (node.name, name))
+        self._line(indent, "if %s.type != %d: raise TypeError(%r)" % (name, TypedClass.LIST, node.error_msg))
+        return name
+
+    def _emit_ListExpr(self, node, indent):
+        items = [ self.emit(item, indent) for item in node.items ]
+        name = self._name()
+        self._line(indent, "%s = TypedList([%s])" % (name, ", ".join(items)))
+        return name
+
+    def _emit_Assign(self, node, indent):
+        value = self.emit(node.expression, indent)
+        self._line(indent, "define(%r, %s)" % (node.name, value))
+        return "None"
+
+    def _emit_Sequence(self, node, indent):
+        v1 = self.emit(node.first, indent)
+        v2 = self.emit(node.second, indent)
+        name = self._name()
+        self._line(indent, "%s = %s if %s is not None else (%s if %s is not None else TypedClass(None, %d))" % (name, v2, v2, v1, v1, TypedClass.UNKNOWN))
+        return name
+
+    def _emit_Not(self, node, indent):
+        v = self.emit(node.expression, indent)
+        name = self._name()
+        self._line(indent, "if %s.type != %d: raise TypeError('operator invalid for this type')" % (v, TypedClass.BOOLEAN))
+        self._line(indent, "%s = _FALSE if %s.value else _TRUE" % (name, v))
+        return name
+
+    def _emit_Negate(self, node, indent):
+        v = self.emit(node.expression, indent)
+        name = self._name()
+        self._line(indent, "if %s.type != %d: raise TypeError('operator invalid for this type')" % (v, TypedClass.NUMBER))
+        self._line(indent, "%s = TypedClass(-%s.value, %d)" % (name, v, TypedClass.NUMBER))
+        return name
+
+    def _emit_operands(self, node, indent):
+        v1 = self.emit(node.left, indent)
+        v2 = self.emit(node.right, indent)
+        self._line(indent, "if autodefine and (%s.type == %d or %s.type == %d): _init_vars(%s, %s)" % (v1, TypedClass.UNKNOWN, v2, TypedClass.UNKNOWN, v1, v2))
+        self._line(indent, "if %s.type != %s.type: raise TypeError()" % (v1, v2))
+        return v1, v2
+
+    def _emit_Compare(self, node, indent):
+        v1, v2 = self._emit_operands(node, indent)
+        name = self._name()
+        self._line(indent, "if %s.type == %d: raise TypeError('operator not defined for lists')" % (v1, TypedClass.LIST))
+        if not node._string_op:
+            self._line(indent, "if %s.type == %d: raise TypeError('operator not defined for strings')" % (v1, TypedClass.STRING))
+        if node._f is None:
+            return "None"
+        if node._bool_result:
+            self._line(indent, "%s = _TRUE if %s.value %s %s.value else _FALSE" % (name, v1, self._PYTHON_OPERATORS[node.op], v2))
+        else:
+            self._line(indent, "%s = TypedClass(%s.value %s %s.value, %d)" % (name, v1, self._PYTHON_OPERATORS[node.op], v2, TypedClass.BOOLEAN))
+        return name
+
+    def _emit_BinOp(self, node, indent):
+        v1, v2 = self._emit_operands(node, indent)
+        name = self._name()
+        self._line(indent, "if %s.type == %d:" % (v1, TypedClass.NUMBER))
+        self._line(indent + 1, "%s = TypedClass(%s.value %s %s.value, %d)" % (name, v1, self._PYTHON_OPERATORS[node.op], v2, TypedClass.NUMBER))
+        if node.op == '+':
+            self._line(indent, "elif %s.type == %d:" % (v1, TypedClass.LIST))
+            self._line(indent + 1, "%s = TypedList(%s.value + %s.value)" % (name, v1, v2))
+            self._line(indent, "elif %s.type == %d:" % (v1, TypedClass.STRING))
+            self._line(indent + 1, "%s = TypedClass(%s.value + %s.value, %d)" % (name, v1, v2, TypedClass.STRING))
+        else:
+            self._line(indent, "elif %s.type == %d:" % (v1, TypedClass.LIST))
+            self._line(indent + 1, "raise TypeError('operator not defined for lists')")
+            self._line(indent, "elif %s.type == %d:" % (v1, TypedClass.STRING))
+            self._line(indent + 1, "raise TypeError('operator not defined for strings')")
+        self._line(indent, "else:")
+        self._line(indent + 1, "raise TypeError('operator invalid for this type')")
+        return name
+
+    def _emit_In(self, node, indent):
+        v = self.emit(node.left, indent)
+        l = self.emit(node.right, indent)
+        name = self._name()
+        item = self._name("x")
+        if not isinstance(node.right, _ListVar):
+            # (a _ListVar has already checked that it is a list)
+            self._line(indent, "if %s.type != %d: raise TypeError('expected list for IN operator')" % (l, TypedClass.LIST))
+        # explicit loops are faster than any() with a generator expression
+        self._line(indent, "%s = _FALSE" % name)
+        self._line(indent, "for %s in %s.value:" % (item, l))
+        self._line(indent + 1, "if %s == %s:" % (v, item))
+        self._line(indent + 2, "%s = _TRUE" % name)
+        self._line(indent + 2, "break")
+        return name
+
+    def _emit_Subset(self, node, indent):
+        l1 = self.emit(node.left, indent)
+        l2 = self.emit(node.right, indent)
+        name = self._name()
+        self._line(indent, "if %s.type != %d: raise TypeError('lists expected for SUBSET operator')" % (l1, TypedClass.LIST))
+        if not isinstance(node.right, _ListVar):
+            self._line(indent, "if %s.type != %d: raise TypeError('lists expected for SUBSET operator')" % (l2, TypedClass.LIST))
+        (item1, item2) = (self._name("x"), self._name("x"))
+        self._line(indent, "%s = _TRUE" % name)
+        self._line(indent, "for %s in %s.value:" % (item1, l1))
+        self._line(indent + 1, "for %s in %s.value:" % (item2, l2))
+        self._line(indent + 2, "if %s == %s: break" % (item1, item2))
+        self._line(indent + 1, "else:")
+        self._line(indent + 2, "%s = _FALSE" % name)
+        self._line(indent + 2, "break")
+        return name
+
+    def _emit_LazyBoolOp(self, node, indent):
+        # The operands are evaluated one after the other inside a loop that is left as soon as one of
+        #   them decides the result, so the code does not nest deeper with the number of operands (the
+        #   operands are not reordered in the native code). As in _LazyBoolOp, the first error is only
+        #   raised if no operand decides the result.
+        name = self._name()
+        error = self._name("e")
+        decisive = node._decisive
+        self._line(indent, "%s = %s" % (name, "_FALSE" if decisive else "_TRUE"))
+        self._line(indent, "%s = None" % error)
+        self._line(indent, "while True:")
+        for child in node.children():
+            self._line(indent + 1, "try:")
+            v = self.emit(child, indent + 2)
+            self._line(indent + 2, "if %s.type != %d:" % (v, TypedClass.BOOLEAN))
+            self._line(indent + 3, "if %s.type == %d and autodefine: _init_vars(%s, _FALSE)" % (v, TypedClass.UNKNOWN, v))
+            self._line(indent + 3, "else: raise TypeError()")
+            self._line(indent + 1, "except Exception as e:")
+            self._line(indent + 2, "if %s is None: %s = e" % (error, error))
+            self._line(indent + 1, "else:")
+            self._line(indent + 2, "if bool(%s.value) == %s:" % (v, decisive))
+            self._line(indent + 3, "%s = %s" % (name, "_TRUE" if decisive else "_FALSE"))
+            self._line(indent + 3, "break")
+        self._line(indent + 1, "if %s is not None: raise %s" % (error, error))
+        self._line(indent + 1, "break")
+        return name
+
+class _Native(_Node):
+    '''
+    This node evaluates a tree by means of a Python function that has been generated from it and
+      compiled with the builtin compile(), which avoids the overhead of walking the tree.
+    '''
+    def __init__(self, tree):
+        self.tree = tree
+        generator = _CodeGenerator()
+        self.source = generator.generate(tree)
+        namespace = generator.namespace
+        exec(compile(self.source, "<evaluate.native>", "exec"), namespace)
+        self._f = namespace["_evaluate"]
+
+    def __reduce__(self):
+        # The generated function cannot be pickled, so it is generated again
+        return (_Native, (self.tree,))
+
+    def evaluate(self, scope):
+        return self._f(scope)
+
+    def vectorize(self, table):
+        return self.tree.vectorize(table)
+
+    def children(self):
+        return [ self.tree ]
+
+    def with_children(self, children):
+        return _Native(children[0])
+
+    def partial(self, fixed, autodefine):
+        return _Native(self.tree.partial(fixed, autodefine))
+
+    def lazy(self, reorder):
+        return _Native(self.tree.lazy(False))
+
+    def __str__(self):
+        return str(self.tree)
+
+
+class _Counted(_Node):
+    '''
+    A node that counts the times that the node inside it is evaluated and the times that its result
+      is true (it is used by the ExpressionProfiler)
+    '''
+    def __init__(self, node, label):
+        self.node = node
+        self.label = label
+        self.hits = 0
+        self.true = 0
+
+    def evaluate(self, scope):
+        self.hits += 1
+        v = self.node.evaluate(scope)
+        if _is_true(v):
+            self.true += 1
+        return v
+
+    def children(self):
+        return [ self.node ]
+
+    def __str__(self):
+        return str(self.node)
+
+def _node_label(node):
+    if isinstance(node, (_Var, _Literal, _Empty)):
+        return str(node) or "(empty)"
+    if isinstance(node, _Assign):
+        return "%s =" % node.name
+    if isinstance(node, (_BinaryNode, _LazyBoolOp)):
+        return node.op
+    if isinstance(node, _Not):
+        return "!"
+    if isinstance(node, _Negate):
+        return "-"
+    if isinstance(node, _ListExpr):
+        return "[ ]"
+    if isinstance(node, _Sequence):
+        return ";"
+    return node.__class__.__name__
+
+def _instrument(node):
+    # Returns a copy of the tree in which every node is wrapped in a _Counted node (the native code
+    #   is not instrumented, so its tree is evaluated instead)
+    if isinstance(node, _Native):
+        node = node.tree
+    label = _node_label(node)
+    children = node.children()
+    if len(children) > 0:
+        node = node.with_children([ _instrument(child) for child in children ])
+    return _Counted(node, label)
+
+class _ExpressionStats(object):
+    def __init__(self, compiled, samples):
+        self.expr = compiled.expr
+        self.compile_time = None
+        self.evaluations = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.times = collections.deque(maxlen = samples)
+        self.tree = None
+        if compiled._tree is not None:
+            self.tree = _instrument(compiled._tree)
+
+    def percentile(self, p):
+        if len(self.times) == 0:
+            return None
+        times = sorted(self.times)
+        return times[min(len(times) - 1, int(len(times) * p / 100.0))]
+
+    def nodes(self):
+        # Returns the list of tuples (depth, counted node) of the instrumented tree
+        retval = []
+        pending = [ (0, self.tree) ] if self.tree is not None else []
+        while len(pending) > 0:
+            (depth, node) = pending.pop(0)
+            retval.append((depth, node))
+            pending = [ (depth + 1, child) for child in node.node.children() if isinstance(child, _Counted) ] + pending
+        return retval
+
+    def dump(self):
+        return {
+            "expression": self.expr,
+            "compile_time": self.compile_time,
+            "evaluations": self.evaluations,
+            "errors": self.errors,
+            "total_time": self.total_time,
+            "mean_time": self.total_time / self.evaluations if self.evaluations > 0 else None,
+            "p99_time": self.percentile(99),
+            "nodes": [ { "node": node.label, "depth": depth, "hits": node.hits, "true": node.true } for (depth, node) in self.nodes() ]
+        }
+
+class ExpressionProfiler(object):
+    '''
+    This class records, for each expression, the time needed to compile it, the number of
+      evaluations, the cumulative and the 99th percentile of the evaluation time (using the last
+      samples evaluations), and the number of times that each node of the expression has been
+      evaluated (and was true). While it is enabled, the expressions are evaluated by walking an
+      instrumented copy of their tree; when it is disabled the only cost is checking whether it is
+      enabled.
+    '''
+    def __init__(self, samples = 1000):
+        self._lock = threading.Lock()
+        self._samples = samples
+        self._stats = {}
+
+    def _get_stats(self, compiled):
+        # The stats are kept by expression (and variant), not by CompiledExpression, so that the
+        #   expressions that are compiled again are not counted as new ones
+        key = compiled._profile_key
+        stats = self._stats.get(key)
+        if stats is None:
+            self._lock.acquire()
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _ExpressionStats(compiled, self._samples)
+            self._lock.release()
+        return stats
+
+    def compiled(self, compiled, elapsed):
+        self._get_stats(compiled).compile_time = elapsed
+
+    def evaluate(self, compiled, scope):
+        stats = self._get_stats(compiled)
+        t0 = time.time()
+        try:
+            return stats.tree.evaluate(scope)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.time() - t0
+            stats.evaluations += 1
+            stats.total_time += elapsed
+            stats.times.append(elapsed)
+
+    def get_stats(self):
+        # Returns a list with a dictionary of stats for each expression
+        return [ stats.dump() for stats in list(self._stats.values()) ]
+
+    def clear(self):
+        self._lock.acquire()
+        self._stats = {}
+        self._lock.release()
+
+    def explain(self, compiled):
+        # Returns a report of the stats of the expression and the tree of nodes with the hits of each one
+        stats = self._stats.get(compiled._profile_key)
+        if stats is None:
+            stats = _ExpressionStats(compiled, 0)
+        d = stats.dump()
+        lines = [ "expression: %s" % d["expression"] ]
+        if d["compile_time"] is not None:
+            lines.append("compile time: %.6f s" % d["compile_time"])
+        lines.append("evaluations: %d (errors: %d), total time: %.6f s" % (d["evaluations"], d["errors"], d["total_time"]))
+        if d["evaluations"] > 0:
+            lines.append("mean time: %.3f us, p99 time: %.3f us" % (d["mean_time"] * 1e6, d["p99_time"] * 1e6))
+        for node in d["nodes"]:
+            lines.append("%s%-*s hits: %d, true: %d" % ("  " * node["depth"], 30 - 2 * node["depth"], node["node"], node["hits"], node["true"]))
+        return "\n".join(lines)
+
+_profiler = None
+
+def enable_profiling(samples = 1000):
+    # Starts recording stats of the compilation and evaluation of the expressions
+    global _profiler
+    if _profiler is None:
+        _profiler = ExpressionProfiler(samples)
+    return _profiler
+
+def disable_profiling():
+    # Stops recording stats. Returns the profiler, that keeps the stats recorded so far
+    global _profiler
+    profiler = _profiler
+    _profiler = None
+    return profiler
+
+def get_profiler():
+    return _profiler
+
+def get_stats():
+    # Returns the stats recorded for each expression (an empty list if the profiling is not enabled)
+    if _profiler is None:
+        return []
+    return _profiler.get_stats()
+
+def explain(expr):
+    # Returns a report of the stats of the expression (a string or a CompiledExpression)
+    if not isinstance(expr, CompiledExpression):
+        expr = compile_expression(expr)
+    profiler = _profiler
+    if profiler is None:
+        profiler = ExpressionProfiler(0)
+    return profiler.explain(expr)
+
+class CompiledExpression(object):
+    '''
+    This class holds an expression that has been parsed once by an Analyzer, so that it can be
+      evaluated many times (e.g. against the keywords of different hosts) without lexing nor
+      parsing it again.
+    The variant describes how the expression was obtained from the compiled one (by means of partial,
+      lazy or native), so that the profiler keeps the stats of the same expression together even if it
+      has been compiled again (e.g. because it is not in the cache).
+    '''
+    def __init__(self, expr, tree, variant = None):
+        self.expr = expr
+        self._tree = tree
+        self._variables = None
+        self._variant = variant
+        self._profile_key = (ExpressionCache.normalize(expr), variant)
+
+    def _evaluate(self, scope):
+        if self._tree is None:
+            return None
+        if _profiler is not None:
+            return _profiler.evaluate(self, scope)
+        return self._tree.evaluate(scope)
+
+    def evaluate(self, _vars = None, autodefinevars = True):
+        # Evaluates the expression using the variables in _vars (a dictionary of TypedClass values).
+        #   The dictionary is not modified: the assignments and the vars defined on the fly are
+        #   only visible during this evaluation.
+        if _vars is None:
+            _vars = {}
+        return self._evaluate(_Scope(_vars, autodefinevars))
+
+    def evaluate_many(self, vars_iterable, autodefinevars = True):
+        # Evaluates the expression against each of the dictionaries of variables in vars_iterable (e.g.
+        #   the keywords of each host). It yields a pair (result, error) for each of them, where error
+        #   is the exception raised by that evaluation (and then result is None) or None.
+        tree = self._tree
+        if tree is None or isinstance(tree, _Literal):
+            constant = self._evaluate(None)
+            for _vars in vars_iterable:
+                yield (constant, None)
+            return
+
+        evaluate = tree.evaluate
+        if _profiler is not None:
+            evaluate = self._evaluate
+        for _vars in vars_iterable:
+            try:
+                yield (evaluate(_Scope(_vars, autodefinevars)), None)
+            except Exception as e:
+                yield (None, e)
+
+    def evaluate_columns(self, table, autodefinevars = True):
+        # Evaluates the expression for all the rows of a ColumnarTable and returns a boolean mask
+        #   (a NumPy array, or a list if NumPy is not available) with True for the rows that fulfil
+        #   the expression. The arithmetic, comparison and boolean operators are evaluated as vectorized
+        #   NumPy operations; the expressions that cannot be vectorized (e.g. lists, IN or SUBSET)
+        #   are evaluated row by row. The rows whose evaluation raises an error are False.
+        if _numpy_available and self._tree is not None and len(table) > 0:
+            try:
+                (_type, values) = self._tree.vectorize(table)
+                if _type != TypedClass.BOOLEAN:
+                    return numpy.zeros(len(table), dtype = bool)
+                return numpy.broadcast_to(numpy.asarray(values, dtype = bool), (len(table),)).copy()
+            except _NotVectorizable:
+                pass
+
+        mask = [ _is_true(v) for (v, _) in self.evaluate_many(table.rows, autodefinevars) ]
+        if _numpy_available:
+            return numpy.array(mask, dtype = bool)
+        return mask
+
+    def partial(self, fixed_vars, autodefinevars = True):
+        # Returns a new CompiledExpression in which the vars in fixed_vars (e.g. the static constants
+        #   of the cluster) have been replaced by their values and the constant sub-expressions have
+        #   been folded. The vars that are assigned in the expression are not replaced.
+        if self._tree is None:
+            return self
+        fixed = dict(fixed_vars)
+        for node in self._tree.walk():
+            if isinstance(node, _Assign):
+                fixed.pop(node.name, None)
+        tree = self._tree.partial(fixed, autodefinevars)
+        return CompiledExpression(self.expr, tree, (self._variant, "partial", str(tree)))
+
+    def lazy(self, reorder = True):
+        # Returns a new CompiledExpression in which the && and || operators are short-circuited, so
+        #   that the right hand side is not evaluated when the left one already decides the result.
+        #   If reorder is True, the operands of each chain of && (or ||) are reordered according to
+        #   their measured cost and selectivity (only if the expression has no assignments, because
+        #   then the order matters). The operands must be booleans: e.g. 3 && 4 raises a TypeError.
+        if self._tree is None:
+            return self
+        if reorder:
+            for node in self._tree.walk():
+                if isinstance(node, _Assign):
+                    reorder = False
+                    break
+        return CompiledExpression(self.expr, self._tree.lazy(reorder), (self._variant, "lazy", reorder))
+
+    def native(self):
+        # Returns a new CompiledExpression that is evaluated by a Python function generated from the
+        #   expression (see _Native), with the same results, errors and side effects.
+        if self._tree is None or isinstance(self._tree, _Native):
+            return self
+        return CompiledExpression(self.expr, _Native(self._tree), (self._variant, "native"))
+
+    def variables(self):
+        # Returns the set of names of the vars that the expression reads (or assigns)
+        if self._variables is None:
+            names = set()
+            if self._tree is not None:
+                for node in self._tree.walk():
+                    if isinstance(node, (_Var, _Assign)):
+                        names.add(node.name)
+            self._variables = frozenset(names)
+        return self._variables
+
+    def is_constant(self):
+        return isinstance(self._tree, _Literal)
+
+    def is_tautology(self):
+        return self.is_constant() and _is_true(self._tree.value)
+
+    def is_contradiction(self):
+        return self.is_constant() and not _is_true(self._tree.value)
+
+    def __str__(self):
+        return str(self._tree)
+
+
+class HostStateStore(object):
+    '''
+    This class holds the keywords of a set of hosts and records when each keyword of each host
+      changes, by means of a version number that increases with each change (the keywords that
+      are removed also change their version).
+    '''
+    def __init__(self):
+        self._hosts = {}
+        self._versions = {}
+        self._created = {}
+        self._version = 0
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def hosts(self):
+        return list(self._hosts.keys())
+
+    def has_host(self, host):
+        return host in self._hosts
+
+    def get_vars(self, host):
+        return self._hosts[host]
+
+    def version(self):
+        return self._version
+
+    def _changed(self, host, keyword):
+        self._version += 1
+        self._versions[host][keyword] = self._version
+
+    def _add(self, host):
+        # A host that is added again must not reuse the results of the previous one
+        self._version += 1
+        self._hosts[host] = {}
+        self._versions[host] = {}
+        self._created[host] = self._version
+
+    def update_host(self, host, _vars):
+        # Sets the whole set of keywords of the host (the keywords that are not in _vars are removed).
+        #   Returns the list of keywords that have changed.
+        if host not in self._hosts:
+            self._add(host)
+        current = self._hosts[host]
+        changed = [ k for k in list(current.keys()) if k not in _vars ]
+        for k in changed:
+            del current[k]
+            self._changed(host, k)
+        return changed + self.set_keywords(host, _vars)
+
+    def set_keywords(self, host, _vars):
+        # Updates some keywords of the host (the rest of keywords are kept). Returns the list of
+        #   keywords that have changed.
+        if host not in self._hosts:
+            self._add(host)
+        current = self._hosts[host]
+        changed = []
         for k, v in list(_vars.items()):
-            self._VAR_VALUES[k] = v
+            old = current.get(k)
+            if old is None or not (old == v):
+                current[k] = v
+                self._changed(host, k)
+                changed.append(k)
+        return changed
+
+    def remove_host(self, host):
+        if host not in self._hosts:
+            return False
+        del self._hosts[host]
+        del self._versions[host]
+        del self._created[host]
+        return True
+
+    def changed_since(self, host, version, keywords):
+        # Returns True if any of the keywords of the host has changed after the version
+        if self._created[host] > version:
+            return True
+        versions = self._versions[host]
+        for k in keywords:
+            if versions.get(k, 0) > version:
+                return True
+        return False
+
+class IncrementalEvaluator(object):
+    '''
+    This class evaluates compiled expressions against the hosts in a HostStateStore and memoizes
+      the results. A result is only evaluated again if any of the keywords that the expression
+      reads has changed in the host since the last evaluation.
+    '''
+    def __init__(self, store, autodefinevars = True):
+        self.store = store
+        self._autodefine_vars = autodefinevars
+        self._results = {}
+        self.evaluations = 0
+        self.reuses = 0
+
+    def _get_results(self, compiled):
+        results = self._results.get(compiled)
+        if results is None:
+            results = self._results[compiled] = {}
+        return results
+
+    def _purge(self, compiled):
+        # Removes the results of the hosts that are no longer in the store (once all the hosts in the store
+        #   have been evaluated, there are more results than hosts only if some of them have been removed)
+        results = self._get_results(compiled)
+        if len(results) > len(self.store):
+            for host in [ host for host in results if not self.store.has_host(host) ]:
+                del results[host]
+
+    def evaluate(self, compiled, host):
+        # Returns the pair (result, error) of evaluating the expression for the host
+        results = self._get_results(compiled)
+        entry = results.get(host)
+        if entry is not None and not self.store.changed_since(host, entry[0], compiled.variables()):
+            self.reuses += 1
+            return (entry[1], entry[2])
+
+        version = self.store.version()
+        try:
+            entry = (version, compiled.evaluate(self.store.get_vars(host), self._autodefine_vars), None)
+        except Exception as e:
+            entry = (version, None, e)
+        results[host] = entry
+        self.evaluations += 1
+        return (entry[1], entry[2])
+
+    def evaluate_all(self, compiled):
+        # Returns a dictionary with the pair (result, error) for each host in the store
+        retval = {}
+        for host in self.store.hosts():
+            retval[host] = self.evaluate(compiled, host)
+        self._purge(compiled)
+        return retval
 
+    def match(self, compiled):
+        # Returns the list of hosts that fulfil the expression
+        retval = [ host for host in self.store.hosts() if _is_true(self.evaluate(compiled, host)[0]) ]
+        self._purge(compiled)
+        return retval
+
+    def forget(self, compiled = None, host = None):
+        # Removes the memoized results of an expression, of a host or all of them
+        if compiled is not None:
+            self._results.pop(compiled, None)
+            if host is None:
+                return
+        for results in list(self._results.values()):
+            if host is None:
+                results.clear()
+            else:
+                results.pop(host, None)
+
+def _index_key(v):
+    # The key used to index a value in a HostIndex (None if the value cannot be indexed)
+    if v.type in [ TypedClass.STRING, TypedClass.NUMBER, TypedClass.BOOLEAN ]:
+        return (v.type, v.value)
+    return None
+
+_DEFAULT_VALUES = { TypedClass.STRING: "", TypedClass.NUMBER: 0, TypedClass.BOOLEAN: False }
+
+class HostIndex(object):
+    '''
+    This class is an inverted index of the keywords of a set of hosts, that maps each pair (keyword,
+      value) to the set of hosts that hold it (either as the value of the keyword or as an item of
+      a list). It is used to obtain the candidate hosts for the predicates such as hostname == "x",
+      "all.q" in queues or properties subset [ ... ], so that the expression only needs to be
+      fully evaluated for the hosts that survive the filter.
+    '''
+    def __init__(self):
+        self._hosts = {}
+        self._values = {}
+        self._items = {}
+        self._holders = {}
+        self._empty_lists = {}
+        self._list_sizes = {}
+        self._opaque = {}
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def hosts(self):
+        return list(self._hosts.keys())
+
+    def get_vars(self, host):
+        return self._hosts[host]
+
+    def add_host(self, host, _vars):
+        # Adds the keywords of a host to the index (replacing the previous ones, if the host was indexed)
+        if host in self._hosts:
+            self.remove_host(host)
+        self._hosts[host] = _vars
+        for k, v in list(_vars.items()):
+            self._holders.setdefault(k, set()).add(host)
+            if v.type == TypedClass.LIST:
+                keys = set()
+                for item in v.value:
+                    key = _index_key(item)
+                    if key is None:
+                        keys = None
+                        break
+                    keys.add(key)
+                if keys is None:
+                    self._opaque.setdefault(k, set()).add(host)
+                    continue
+                for key in keys:
+                    self._items.setdefault((k, key), set()).add(host)
+                self._list_sizes[(k, host)] = len(keys)
+                if len(keys) == 0:
+                    self._empty_lists.setdefault(k, set()).add(host)
+            else:
+                key = _index_key(v)
+                if key is None:
+                    self._opaque.setdefault(k, set()).add(host)
+                else:
+                    self._values.setdefault((k, key), set()).add(host)
+
+    def remove_host(self, host):
+        _vars = self._hosts.pop(host, None)
+        if _vars is None:
+            return False
+        for k, v in list(_vars.items()):
+            for d, key in [ (self._holders, k), (self._opaque, k), (self._empty_lists, k), (self._values, (k, _index_key(v))) ]:
+                if key in d:
+                    d[key].discard(host)
+            if v.type == TypedClass.LIST:
+                self._list_sizes.pop((k, host), None)
+                for item in v.value:
+                    hosts = self._items.get((k, _index_key(item)))
+                    if hosts is not None:
+                        hosts.discard(host)
+        return True
+
+    def _missing(self, keyword):
+        return set(self._hosts.keys()) - self._holders.get(keyword, set())
+
+    def _candidates(self, node, autodefine):
+        # Returns a set of hosts that includes every host for which the node may be true, or None if
+        #   the index cannot be used for this node.
+        if isinstance(node, _Native):
+            return self._candidates(node.tree, autodefine)
+
+        if isinstance(node, _LazyBoolOp):
+            result = None
+            for child in node.children():
+                c = self._candidates(child, autodefine)
+                if node.op == '&&':
+                    if c is not None:
+                        result = c if result is None else result & c
+                else:
+                    if c is None:
+                        return None
+                    result = c if result is None else result | c
+            return result
+
+        if isinstance(node, _Compare):
+            if node.op in [ '&&', '||' ]:
+                c1 = self._candidates(node.left, autodefine)
+                c2 = self._candidates(node.right, autodefine)
+                if node.op == '&&':
+                    if c1 is None: return c2
+                    if c2 is None: return c1
+                    return c1 & c2
+                if c1 is None or c2 is None:
+                    return None
+                return c1 | c2
+            if node.op == '==':
+                var, literal = node.left, node.right
+                if isinstance(var, _Literal):
+                    var, literal = literal, var
+                if type(var) is not _Var or not isinstance(literal, _Literal):
+                    return None
+                key = _index_key(literal.value)
+                if key is None:
+                    return None
+                result = self._values.get((var.name, key), set()) | self._opaque.get(var.name, set())
+                if autodefine and _DEFAULT_VALUES[key[0]] == key[1]:
+                    # The hosts that do not have the keyword will define it with the default value
+                    result = result | self._missing(var.name)
+                return result
+            return None
+
+        if isinstance(node, _In):
+            if not isinstance(node.left, _Literal) or not isinstance(node.right, _ListVar):
+                return None
+            key = _index_key(node.left.value)
+            if key is None:
+                return None
+            name = node.right.name
+            return self._items.get((name, key), set()) | self._opaque.get(name, set())
+
+        if isinstance(node, _Subset):
+            if type(node.left) is not _Var or not isinstance(node.right, _ListExpr):
+                return None
+            keys = set()
+            for item in node.right.items:
+                if not isinstance(item, _Literal):
+                    return None
+                key = _index_key(item.value)
+                if key is None:
+                    return None
+                keys.add(key)
+            name = node.left.name
+            counts = {}
+            for key in keys:
+                for host in self._items.get((name, key), []):
+                    counts[host] = counts.get(host, 0) + 1
+            result = set([ host for host, count in list(counts.items()) if self._list_sizes.get((name, host)) == count ])
+            return result | self._empty_lists.get(name, set()) | self._opaque.get(name, set())
+
+        return None
+
+    def candidates(self, compiled, autodefinevars = True):
+        # Returns the set of hosts that may fulfil the compiled expression, or None if the index
+        #   cannot reduce the set of hosts for this expression.
+        tree = compiled._tree
+        if tree is None:
+            return None
+        if compiled.is_contradiction():
+            return set()
+        for node in tree.walk():
+            if isinstance(node, _Assign):
+                return None
+        return self._candidates(tree, autodefinevars)
+
+    def match(self, compiled, autodefinevars = True):
+        # Returns the list of hosts that fulfil the compiled expression. The index is used to obtain
+        #   the candidate hosts and the expression is only evaluated for them.
+        hosts = self.candidates(compiled, autodefinevars)
+        if hosts is None:
+            hosts = list(self._hosts.keys())
+        else:
+            hosts = [ host for host in self._hosts if host in hosts ]
+        return [ host for host, (v, _) in zip(hosts, compiled.evaluate_many([ self._hosts[host] for host in hosts ], autodefinevars)) if _is_true(v) ]
+
+
+def _move_to_end(entries, key):
+    # Moves the key to the end of the OrderedDict (move_to_end does not exist in python 2)
+    if hasattr(entries, "move_to_end"):
+        entries.move_to_end(key)
+    else:
+        entries[key] = entries.pop(key)
+
+class ExpressionCache(object):
+    '''
+    This class implements a bounded cache of compiled expressions, keyed by the text of the expression.
+      A size of 0 disables the cache. It is safe to use it from different threads.
+    Getting an expression does not acquire the lock (it only marks the entry as referenced), so the
+      least recently used order is approximated: when the cache is full, the oldest entries that have
+      been referenced since they were inserted get a second chance (they are moved to the end and
+      unmarked) and the first one that has not been referenced is evicted. For the same reason, the
+      counters of hits and misses are approximate when several threads use the cache.
+    '''
+    def __init__(self, size = 1024):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._size = size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(expr):
+        return expr.strip()
+
+    def get(self, expr):
+        # Returns the compiled expression for expr or None if it is not in the cache
+        entry = self._entries.get(self.normalize(expr))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry[1] = True
+        return entry[0]
+
+    def put(self, expr, compiled):
+        if self._size <= 0:
+            return
+        key = self.normalize(expr)
+        self._lock.acquire()
+        self._entries[key] = [ compiled, False ]
+        _move_to_end(self._entries, key)
+        self._evict()
+        self._lock.release()
+
+    def _evict(self):
+        while len(self._entries) > self._size:
+            (key, entry) = self._entries.popitem(last = False)
+            if entry[1] and (self._size > 0):
+                entry[1] = False
+                self._entries[key] = entry
+            else:
+                self.evictions += 1
+
+    def resize(self, size):
+        self._lock.acquire()
+        self._size = size
+        self._evict()
+        self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock.release()
+
+    def stats(self):
+        self._lock.acquire()
+        retval = { "size": self._size, "entries": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions }
+        self._lock.release()
+        return retval
+
+    def __len__(self):
+        return len(self._entries)
+
+_expression_cache = ExpressionCache()
+
+def get_expression_cache():
+    return _expression_cache
+
+def set_expression_cache(cache):
+    # Sets the cache used by the Analyzers (None disables the cache)
+    global _expression_cache
+    _expression_cache = cache
+
+class _Grammar(object):
+    '''
+    The tokens and the rules of the grammar of the expressions. The actions of the rules build the
+      tree of nodes of the expression and do not depend on the state of any analyzer, so the lexer
+      and the parser tables that PLY builds from this grammar are shared by all the analyzers.
+    '''
     tokens = (
         'NUMBER','VAR','COMMA','SQ_LPAREN','SQ_RPAREN','LPAREN','RPAREN',
         'TRUE','FALSE','IN','SUBSET','EQ','LT','GT','LE','NE','GE','AND','OR','EQUALS','STRING','NOT',
@@ -306,36 +2028,10 @@ class Analyzer:
         t.type = self.reserved.get(t.value.lower(), 'VAR')
         return t
 
-    def _init_vars(self, v1, v2):
-        if v1.type == TypedClass.UNKNOWN:
-            if v2.type == TypedClass.LIST:
-                v1.value = []
-            elif v2.type == TypedClass.BOOLEAN:
-                v1.value = False
-            elif v2.type == TypedClass.NUMBER:
-                v1.value = 0
-            elif v2.type == TypedClass.STRING:
-                v1.value = ""
-            else:
-                v1.value = None
-            v1.type = v2.type
-
-        if v2.type == TypedClass.UNKNOWN:
-            if v1.type == TypedClass.LIST:
-                v2.value = []
-            elif v1.type == TypedClass.BOOLEAN:
-                v2.value = False
-            elif v1.type == TypedClass.NUMBER:
-                v2.value = 0
-            elif v1.type == TypedClass.STRING:
-                v2.value = ""
-            else:
-                v2.value = None
-            v2.type = v1.type
-
     t_ignore = " \t\n"
 
     def t_error(self, t):
+        _syntax_errors.count = getattr(_syntax_errors, "count", 0) + 1
         print("Illegal character '%s'" % t.value[0])
         t.lexer.skip(1)
 
@@ -363,24 +2059,19 @@ class Analyzer:
         ''' kwl : 
         '''
         _LOGGER.debug("kwl -> ")
-        p[0] = TypedClass(None, TypedClass.UNKNOWN)
+        p[0] = _Empty()
     
     def p_kwl_kwl(self, p):
         ''' kwl : kwl SEPARATOR kwl 
         '''
         _LOGGER.debug("kwl -> kwl ; kwl")
-        if p[3] is not None:
-            p[0] = p[3]
-        elif p[1] is not None:
-            p[0] = p[1]
-        else:
-            p[0] = TypedClass(None, TypedClass.UNKNOWN)
+        p[0] = _Sequence(p[1], p[3])
             
     def p_statement_assign(self, p):
         ''' statement : VAR EQUALS expression
         '''
         _LOGGER.debug("statement -> VAR '=' expression")
-        self.add_vars({p[1]: p[3]})
+        p[0] = _Assign(p[1], p[3])
 
     def p_statement_expr(self, p):
         ''' statement : expression
@@ -393,10 +2084,7 @@ class Analyzer:
                         | '!' expression
         '''
         _LOGGER.debug("expresion -> ! expression")
-        if p[2].type == TypedClass.BOOLEAN: 
-            p[0] = TypedClass(not p[2].value, TypedClass.BOOLEAN)
-        else:
-            raise TypeError("operator invalid for this type")
+        p[0] = _Not(p[2])
 
     def p_expression_boolop(self, p):
         """
@@ -410,38 +2098,7 @@ class Analyzer:
                   | expression OR expression
         """
         _LOGGER.debug("expresion -> expresion %s expression" % p[2])
-        if self._autodefine_vars:
-            self._init_vars(p[1], p[3])
-
-        if p[1].type != p[3].type: raise TypeError()
-
-        if p[1].type == TypedClass.LIST:
-            raise TypeError("operator not defined for lists")
-        if p[1].type == TypedClass.STRING:
-            if p[2] == '==':
-                p[0] = TypedClass(p[1].value == p[3].value, TypedClass.BOOLEAN)
-            elif p[2] == '!=':
-                p[0] = TypedClass(p[1].value != p[3].value, TypedClass.BOOLEAN)
-            else:
-                raise TypeError("operator not defined for strings")
-
-        if p[2] == '>':
-            p[0] = TypedClass(p[1].value > p[3].value, TypedClass.BOOLEAN)
-        elif p[2] == '<':
-            p[0] = TypedClass(p[1].value < p[3].value, TypedClass.BOOLEAN)
-        elif p[2] == '>=':
-            p[0] = TypedClass(p[1].value >= p[3].value, TypedClass.BOOLEAN)
-        elif p[2] == '<=':
-            p[0] = TypedClass(p[1].value <= p[3].value, TypedClass.BOOLEAN)
-        elif p[2] == '==':
-            p[0] = TypedClass(p[1].value == p[3].value, TypedClass.BOOLEAN)
-        elif p[2] == '!=':
-            p[0] = TypedClass(p[1].value != p[3].value, TypedClass.BOOLEAN)
-        elif p[2] == '&&':
-            p[0] = TypedClass(p[1].value and p[3].value, TypedClass.BOOLEAN)
-        elif p[2] == '||':
-            p[0] = TypedClass(p[1].value or p[3].value, TypedClass.BOOLEAN)
-
+        p[0] = _Compare(p[2], p[1], p[3])
 
     def p_expression_binop(self, p):
         """
@@ -451,117 +2108,38 @@ class Analyzer:
                   | expression DIVIDE expression
         """
         _LOGGER.debug("expresion -> expresion %s expression" % p[2])
-
-        if self._autodefine_vars:
-            self._init_vars(p[1], p[3])
-
-        if p[1].type != p[3].type: raise TypeError()
-        
-        if p[1].type == TypedClass.LIST:
-            if p[2] == '+':
-                p[0] = TypedList(p[1].value + p[3].value)
-            else:
-                raise TypeError('operator not defined for lists')
-        elif p[1].type == TypedClass.STRING:
-            if p[2] == '+':
-                p[0] = TypedClass(p[1].value + p[3].value, TypedClass.STRING)
-            else:
-                raise TypeError('operator not defined for strings')
-        elif p[1].type == TypedClass.NUMBER: 
-            if p[2] == '+':
-                p[0] = TypedClass(p[1].value + p[3].value, TypedClass.NUMBER)
-            elif p[2] == '-':
-                p[0] = TypedClass(p[1].value - p[3].value, TypedClass.NUMBER)
-            if p[2] == '*':
-                p[0] = TypedClass(p[1].value * p[3].value, TypedClass.NUMBER)
-            if p[2] == '/':
-                p[0] = TypedClass(p[1].value / p[3].value, TypedClass.NUMBER)
-        else:
-            raise TypeError("operator invalid for this type")
+        p[0] = _BinOp(p[2], p[1], p[3])
 
     def p_expression_inlist(self, p):
         ''' expression    :   expression IN lexp 
         '''
         _LOGGER.debug("expresion -> expresion IN lexp")
-
-        if self._autodefine_vars:
-            self._init_vars(TypedList([]), p[3])
-
-        if p[3].type != TypedClass.LIST: raise TypeError("expected list for IN operator")
-        
-        retval = False
-        for v in p[3].value:
-            if p[1] == v:
-                retval = True
-                break
-        
-        p[0] = TypedClass(retval, TypedClass.BOOLEAN)
+        p[0] = _In(p[1], p[3])
     
     def p_expression_invar(self, p):
         ''' expression    :   expression IN VAR 
         '''
         _LOGGER.debug("expresion -> expresion IN VAR")
-    
-        if p[3] not in self._VAR_VALUES:
-            if self._autodefine_vars:
-                self._VAR_VALUES[p[3]] = TypedList([])
-            else:
-                raise TypeError("list expected for IN operator")
-            
-        l = self._VAR_VALUES[p[3]]
-        if l.type != TypedList.LIST: raise TypeError("list expected for IN operator")
-        p[3] = l
-        
-        self.p_expression_inlist(p)
-
+        p[0] = _In(p[1], _ListVar(p[3], "list expected for IN operator"))
 
     def p_expression_subsetlist(self, p):
         ''' expression    :   expression SUBSET lexp 
         '''
         _LOGGER.debug("expresion -> expresion SUBSET lexp")
-    
-        if p[1].type != TypedClass.LIST: raise TypeError("lists expected for SUBSET operator")
-        if p[3].type != TypedClass.LIST: raise TypeError("lists expected for SUBSET operator")
-        
-        retval = True
-        for vl in p[1].value:
-            found = False
-            for vr in p[3].value:
-                if vl == vr:
-                    found = True
-                    break
-            if not found:
-                retval = False
-                break
-        
-        p[0] = TypedClass(retval, TypedClass.BOOLEAN)
+        p[0] = _Subset(p[1], p[3])
     
     def p_expression_subsetvar(self, p):
         ''' expression    :   expression SUBSET VAR 
         '''
         _LOGGER.debug("expresion -> expresion SUBSET VAR")
-    
-        if p[3] not in self._VAR_VALUES:
-            if self._autodefine_vars:
-                self._VAR_VALUES[p[3]] = TypedList([])
-            else:
-                raise TypeError("lists expected for SUBSET operator")
-            
-        l = self._VAR_VALUES[p[3]]
-        if l.type != TypedList.LIST: raise TypeError("lists expected for SUBSET operator")
-        p[3] = l
-        
-        self.p_expression_subsetlist(p)
+        p[0] = _Subset(p[1], _ListVar(p[3], "lists expected for SUBSET operator"))
 
     def p_expression_uminus(self, p):
         ''' expression  :   MINUS expression %prec UMINUS
         '''
         _LOGGER.debug("expresion -> - expresion")
 
-        if p[2].type == TypedClass.NUMBER: 
-            p[0] = TypedClass(-p[2].value, TypedClass.NUMBER)
-        else:
-            raise TypeError("operator invalid for this type")
+        p[0] = _Negate(p[2])
 
     def p_expression_group(self, p):
         ''' expression  :   LPAREN expression RPAREN
@@ -578,6 +2156,7 @@ class Analyzer:
         p[0] = p[1]
 
     def p_error(self, p):
+        _syntax_errors.count = getattr(_syntax_errors, "count", 0) + 1
         if p:
             print("Syntax error at '%s'" % p.value)
         else:
@@ -594,40 +2173,27 @@ class Analyzer:
         '''
         _LOGGER.debug("l -> ")
 
-        p[0] = TypedList( [] )
+        p[0] = _ListExpr( [] )
     
     def p_l_expression(self, p):
         ''' l       :   expression    
         '''
         _LOGGER.debug("l -> expresion")
 
-        l = TypedList( [ p[1] ] )
-        p[0] = l
+        p[0] = _ListExpr( [ p[1] ] )
         
     def p_l_comma_l(self, p):
         ''' l       :   expression COMMA l
         '''
         _LOGGER.debug("l -> expresion , l")
 
-        if p[3].type != TypedClass.LIST: raise TypeError("list expected")
-        l = TypedList( [ p[1] ] + p[3].value)
-        p[0] = l
+        p[0] = _ListExpr( [ p[1] ] + p[3].items )
 
     def p_term_var(self, p):
         ''' term   :    VAR 
         '''
         _LOGGER.debug("term -> VAR")
-        
-        # TODO: determine the type of the var
-        if p[1] not in self._VAR_VALUES:
-            if self._autodefine_vars:
-                self._VAR_VALUES[p[1]] = TypedClass(None, TypedClass.UNKNOWN)
-                
-        if p[1] in self._VAR_VALUES:
-            _LOGGER.debug("term -> VAR")
-            p[0] = self._VAR_VALUES[p[1]]
-        else:
-            raise UndefinedVar()
+        p[0] = _Var(p[1])
     
     def p_term_bool(self, p):
         ''' term    :   TRUE
@@ -635,17 +2201,14 @@ class Analyzer:
         '''
         _LOGGER.debug("term -> TRUE/FALSE")
 
-        if p[1].lower() == 'true':
-            p[0] = TypedClass(True, TypedClass.BOOLEAN)
-        else:
-            p[0] = TypedClass(False, TypedClass.BOOLEAN)
+        p[0] = _Literal(TypedClass(p[1].lower() == 'true', TypedClass.BOOLEAN))
         
     def p_term_num(self, p):
         ''' term    :   NUMBER 
         '''
         _LOGGER.debug("term -> NUM")
         
-        p[0] = TypedNumber(p[1])
+        p[0] = _Literal(TypedNumber(p[1]))
     
     def p_term_lexp(self, p):
         ''' term    :   lexp 
@@ -659,16 +2222,277 @@ class Analyzer:
         '''
         _LOGGER.debug("term -> STRING")
         
-        p[0] = TypedClass(p[1], TypedClass.STRING)
+        p[0] = _Literal(TypedClass(p[1], TypedClass.STRING))
 
     def p_term_empty(self, p):
         ''' term    :   
         '''
         _LOGGER.debug("term -> ")
 
-        p[0] = TypedClass(None, TypedClass.UNKNOWN)
+        p[0] = _Empty()
+
+_grammar = _Grammar()
+_grammar_lock = threading.Lock()
+_lexer = None
+_parser = None
+
+# The parser tables are precomputed in the module evaluate_parsetab (that is imported instead of
+#   generating the tables). If the grammar changes, the tables must be written again by calling
+#   _build_parser(write_tables = True) from the folder of this module.
+if __package__:
+    _PARSETAB = "%s.evaluate_parsetab" % __package__
+else:
+    _PARSETAB = "evaluate_parsetab"
+
+def _build_parser(write_tables = False):
+    import ply.lex as lex
+    import ply.yacc as yacc
+    import os
+    lexer = lex.lex(module=_grammar, debug=0)
+    parser = yacc.yacc(module=_grammar, debug=0, tabmodule=_PARSETAB, write_tables=write_tables, outputdir=os.path.dirname(os.path.abspath(__file__)))
+    return (lexer, parser)
+
+def _get_parser():
+    # Returns the lexer and the parser that are shared in the process (they are built only once)
+    global _lexer, _parser
+    if _parser is None:
+        _grammar_lock.acquire()
+        try:
+            if _parser is None:
+                (_lexer, _parser) = _build_parser()
+        finally:
+            _grammar_lock.release()
+    return (_lexer, _parser)
+
+# The number of syntax errors found by the parsers of each thread
+_syntax_errors = threading.local()
+
+def _compile(expr, lexer, parser):
+    # Compiles the expression using the lexer and the parser (or gets it from the expression cache)
+    cache = _expression_cache
+    if cache is not None:
+        compiled = cache.get(expr)
+        if compiled is not None:
+            return compiled
+
+    profiler = _profiler
+    if profiler is not None:
+        t0 = time.time()
+    errors = getattr(_syntax_errors, "count", 0)
+    compiled = CompiledExpression(expr, parser.parse(expr, debug=0, lexer=lexer))
+    if profiler is not None:
+        profiler.compiled(compiled, time.time() - t0)
+    if (cache is not None) and (getattr(_syntax_errors, "count", 0) == errors):
+        # The expressions with syntax errors are not cached, so that the errors are reported each time
+        cache.put(expr, compiled)
+    return compiled
+
+_thread_data = threading.local()
+
+def compile_expression(expr):
+    # Compiles the expression using a lexer and a parser that belong to the current thread, so it
+    #   can be called from any thread. The CompiledExpression can be shared between threads and
+    #   evaluated concurrently, because each evaluation keeps its own set of variables.
+    parser = getattr(_thread_data, "parser", None)
+    if parser is None:
+        (lexer, parser) = _get_parser()
+        _thread_data.lexer = lexer.clone()
+        _thread_data.parser = parser = copy.copy(parser)
+    return _compile(expr, _thread_data.lexer, parser)
+
+def evaluate(expr, _vars = None, autodefinevars = True):
+    # Evaluates the expression using the variables in _vars, without the need of an Analyzer. The
+    #   dictionary _vars is not modified (see CompiledExpression.evaluate).
+    return compile_expression(expr).evaluate(_vars, autodefinevars)
+
+def evaluate_many(expr, vars_iterable, autodefinevars = True):
+    # Evaluates the expression against each dictionary of variables in vars_iterable, yielding the
+    #   pairs (result, error) (see CompiledExpression.evaluate_many).
+    return compile_expression(expr).evaluate_many(vars_iterable, autodefinevars)
+
+def top_k(expr, rank_expr, hosts, k, autodefinevars = True):
+    # Returns the k hosts that fulfil expr (None means every host) and have the highest value of the
+    #   numeric expression rank_expr (e.g. free_slots * 10 + memory_free / 1024), as a list of pairs
+    #   (rank, host) sorted by decreasing rank (the ties keep the order of the hosts). The hosts are
+    #   a dictionary {host: vars} or an iterable of pairs (host, vars). The hosts are filtered and
+    #   ranked in a single pass that keeps a heap of k elements, instead of sorting all of them; the
+    #   hosts for which any of the expressions raises an error, or whose rank is not a number, are
+    #   skipped.
+    if expr is not None and not isinstance(expr, CompiledExpression):
+        expr = compile_expression(expr)
+    if not isinstance(rank_expr, CompiledExpression):
+        rank_expr = compile_expression(rank_expr)
+    if isinstance(hosts, dict):
+        hosts = hosts.items()
+    if k <= 0:
+        return []
+
+    heap = []
+    for (seq, (host, _vars)) in enumerate(hosts):
+        # The filter and the rank see the same variables (e.g. the vars defined on the fly)
+        scope = _Scope(_vars, autodefinevars)
+        try:
+            if expr is not None and not _is_true(expr._evaluate(scope)):
+                continue
+            rank = rank_expr._evaluate(scope)
+        except Exception:
+            continue
+        if rank is None or rank.type != TypedClass.NUMBER:
+            continue
+
+        # The heap keeps the k best hosts and its first element is the worst of them (for the same
+        #   rank, the host that came later)
+        item = (rank.value, -seq, host)
+        if len(heap) < k:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    return [ (rank, host) for (rank, _, host) in sorted(heap, reverse = True) ]
+
+def _match_rows(compiled_list, hosts, autodefinevars):
+    return [ [ _is_true(v) for (v, _) in compiled.evaluate_many(hosts, autodefinevars) ] for compiled in compiled_list ]
+
+_worker_expressions = None
+
+def _init_matrix_worker(compiled_list, autodefinevars):
+    # Receives the compiled expressions once in each worker process
+    global _worker_expressions
+    _worker_expressions = (compiled_list, autodefinevars)
+
+def _evaluate_shard(hosts):
+    (compiled_list, autodefinevars) = _worker_expressions
+    return _match_rows(compiled_list, hosts, autodefinevars)
+
+def evaluate_matrix(expressions, hosts, workers = None, autodefinevars = True):
+    # Evaluates each expression (a string or a CompiledExpression) against each dictionary of variables
+    #   in hosts, and returns the match matrix: a list with one row for each expression, that contains
+    #   True for the hosts that fulfil it. The hosts are split in one shard for each worker process;
+    #   the compiled expressions are sent once to each worker and each shard is sent to one worker.
+    #   If workers is 1, the matrix is obtained in this process.
+    import multiprocessing
+    compiled_list = [ e if isinstance(e, CompiledExpression) else compile_expression(e) for e in expressions ]
+    hosts = list(hosts)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = max(1, min(workers, len(hosts)))
+    if workers == 1:
+        return _match_rows(compiled_list, hosts, autodefinevars)
+
+    from concurrent.futures import ProcessPoolExecutor
+    shard_size = (len(hosts) + workers - 1) // workers
+    shards = [ hosts[i:i + shard_size] for i in range(0, len(hosts), shard_size) ]
+    matrix = [ [] for _ in compiled_list ]
+    executor = ProcessPoolExecutor(max_workers = workers, initializer = _init_matrix_worker, initargs = (compiled_list, autodefinevars))
+    try:
+        for rows in executor.map(_evaluate_shard, shards):
+            for row, shard_row in zip(matrix, rows):
+                row.extend(shard_row)
+    finally:
+        executor.shutdown()
+    return matrix
+
+class Analyzer:
+    def __init__(self, autodefinevars = True, **kwargs):
+        # The grammar tables are shared by all the analyzers, and each one has its own lexer and
+        #   parser objects (that hold the state of the parsing).
+        (lexer, parser) = _get_parser()
+        if len(kwargs) > 0:
+            import ply.lex as lex
+            self.lexer = lex.lex(module=_grammar, debug=0, **kwargs)
+        else:
+            self.lexer = lexer.clone()
+        self.yacc = copy.copy(parser)
+        self._VAR_VALUES = {}
+        self._autodefine_vars = autodefinevars
+        self._current_expr = ""
+
+    def compile(self, expr):
+        # Parses the expression and returns a CompiledExpression that can be evaluated many times
+        #   without parsing it again. The expressions that have been already compiled are got from
+        #   the expression cache.
+        return _compile(expr, self.lexer, self.yacc)
+
+    def check(self, expr):
+        self._current_expr = expr
+        return self.compile(expr)._evaluate(_Scope(self._VAR_VALUES, self._autodefine_vars, True))
+
+    def evaluate_many(self, expr, vars_iterable):
+        # Compiles the expression once and evaluates it against each dictionary of variables in
+        #   vars_iterable, instead of calling add_vars(..., clear = True) and check() for each one.
+        #   The variables of the analyzer are not used nor modified. It yields pairs (result, error)
+        #   (see CompiledExpression.evaluate_many).
+        self._current_expr = expr
+        return self.compile(expr).evaluate_many(vars_iterable, self._autodefine_vars)
+
+    def clear_vars(self):
+        self._VAR_VALUES = {}
+
+    def get_vars(self):
+        return self._VAR_VALUES
+
+    def add_vars(self, _vars, clear = False):
+        if clear:
+            self.clear_vars()
+            
+        for k, v in list(_vars.items()):
+            self._VAR_VALUES[k] = v
+
+def _benchmark_matrix():
+    # Shows how evaluate_matrix scales with the number of worker processes
+    import multiprocessing
+    import random
+    random.seed(0)
+    hosts = vars_from_strings([ 'ncpus=%d;physmem=%d;loadave=%.2f;queues=[all.q,q%d];state=%s' % (random.choice([1, 2, 4, 8, 16]), random.randint(1, 64) * 1024, random.random() * 4, i % 10, random.choice([ "free", "busy" ])) for i in range(10000) ])
+    expressions = [ 'ncpus >= %d && physmem > %d && loadave < %.1f' % (random.choice([1, 2, 4, 8]), random.randint(1, 64) * 1024, random.random() * 4) for _ in range(100) ]
+    expressions += [ '(q%d in queues) && state == "free"' % (i % 10) for i in range(100) ]
+    reference = None
+    workers = 1
+    while workers <= multiprocessing.cpu_count():
+        t0 = time.time()
+        matrix = evaluate_matrix(expressions, hosts, workers)
+        elapsed = time.time() - t0
+        if reference is None:
+            reference = (matrix, elapsed)
+        print("%d expressions x %d hosts, %2d workers: %.2f s (speed-up %.2f)%s" % (len(expressions), len(hosts), workers, elapsed, reference[1] / elapsed, "" if matrix == reference[0] else " - DIFFERENT RESULTS"))
+        workers *= 2
+
+def _benchmark_memory():
+    # Shows the memory needed to hold the keywords of each host, compared to the same values stored
+    #   in objects with a __dict__ and without sharing any instance (as the TypedClass used to be)
+    import tracemalloc
+
+    class _UnslottedValue(object):
+        def __init__(self, v, t):
+            self.value = v
+            self.type = t
+
+    def unslotted(v):
+        if v.type == TypedClass.LIST:
+            return _UnslottedValue([ unslotted(item) for item in v.value ], v.type)
+        return _UnslottedValue(v.value, v.type)
+
+    hosts = 20000
+    strings = [ 'jobs=;sessions=%d;ncpus=4;physmem=3922492kb;ppn=4;netload=%d;nsessions=1;properties=[lcgpro];nusers=1;idletime=%d;queues=[chemig,tutig,dteam,biomed,ops,ictig,earthig,opsig,lifeig,rollout,engig,socialig,physig];hostname=node%d;loadave=0.00;state=free;opsys=linux;exclusive=false;totmem=5986872kb;rectime=%d' % (i, i * 1000, i * 7, i, 1417717220 + i) for i in range(hosts) ]
+    for title, build in [ ("unslotted values", lambda: [ dict([ (k, unslotted(v)) for k, v in list(vars_from_string(s).items()) ]) for s in strings ]),
+                          ("vars_from_string", lambda: [ vars_from_string(s) for s in strings ]),
+                          ("vars_from_strings", lambda: vars_from_strings(strings)) ]:
+        tracemalloc.start()
+        keywords = build()
+        (current, _) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("%-18s: %7.1f bytes per host (%d hosts, %.1f MB)" % (title, float(current) / hosts, len(keywords), current / 1048576.0))
+        keywords = None
 
 if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark-matrix":
+        _benchmark_matrix()
+        exit()
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark-memory":
+        _benchmark_memory()
+        exit()
+
     logging.basicConfig(filename=None,level=logging.DEBUG)
     
     keywords={'queues': ['all.q',''], 'hostname': 'vnode10.localdomain', 'hostgroups': []}
@@ -681,6 +2505,7 @@ if __name__ == '__main__':
     print(annie.check(' "all.q" in queues '))
     print(annie.check('hostname=="all.q"'))
     print(annie.check('hostname=="vnode10.localdomain"'))
+
     exit()
     
     e=vars_from_string('jobs=;sessions=1181;ncpus=4;physmem=3922492kb;ppn=4;netload=20083230506;uname="Linux ngieswnv1 2.6.32-431.29.2.el6.x86_64 #1 SMP Tue Sep 9 13:45:55 CDT 2014 x86_64";nsessions=1;properties=["lcgpro"];gres=;nusers=1;idletime=521677;queues=["chemig","tutig","dteam","biomed","ops","ictig","earthig","opsig","lifeig","rollout","engig","socialig","physig"];hostname="ngieswnv1";varattr=;loadave=0.00;state="free";opsys="linux";totmem=5986872kb;availmem=5827616kb;rectime=1417717220;')
@@ -0,0 +1,67 @@
+
+# evaluate_parsetab.py
+# This file is automatically generated. Do not edit.
+# pylint: disable=W,C,R
+_tabversion = '3.10'
+
+_lr_method = 'LALR'
+
+_lr_signature = "rightNOTleftORleftANDleftEQNEleftLTLEGTGEleftPLUSMINUSleftTIMESDIVIDErightUMINUSAND COMMA DIVIDE EQ EQUALS FALSE GE GT IN LE LPAREN LT MINUS NE NOT NUMBER OR PLUS RPAREN SEPARATOR SQ_LPAREN SQ_RPAREN STRING SUBSET TIMES TRUE VAR kwl : statement\n         kwl : \n         kwl : kwl SEPARATOR kwl \n         statement : VAR EQUALS expression\n         statement : expression\n         expression  : NOT expression\n                        | '!' expression\n        \n        expression : expression GT expression\n                  | expression LT expression\n                  | expression GE expression\n                  | expression LE expression\n                  | expression EQ expression\n                  | expression NE expression\n                  | expression AND expression\n                  | expression OR expression\n        \n        expression : expression PLUS expression\n                  | expression MINUS expression\n                  | expression TIMES expression\n                  | expression DIVIDE expression\n         expression    :   expression IN lexp \n         expression    :   expression IN VAR \n         expression    :   expression SUBSET lexp \n         expression    :   expression SUBSET VAR \n         expression  :   MINUS expression %prec UMINUS\n         expression  :   LPAREN expression RPAREN\n         expression : term\n         lexp    :   SQ_LPAREN l SQ_RPAREN\n         l       :   \n         l       :   expression    \n         l       :   expression COMMA l\n         term   :    VAR \n         term    :   TRUE\n                    |   FALSE \n         term    :   NUMBER \n         term    :   lexp \n         term    :   STRING \n         term    :   \n        "
+    
+_lr_action_items = {'SEPARATOR':([0,1,2,3,4,5,6,7,8,10,11,12,13,14,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,39,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,],[-2,16,-1,-31,-5,-37,-37,-37,-35,-26,-32,-33,-34,-36,-2,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-6,-31,-7,-24,16,-4,-8,-9,-10,-11,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,]),'$end':([0,1,2,3,4,5,6,7,8,10,11,12,13,14,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,39,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,],[-2,0,-1,-31,-5,-37,-37,-37,-35,-26,-32,-33,-34,-36,-2,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-6,-31,-7,-24,-3,-4,-8,-9,-10,-11,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,]),'VAR':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,31,59,],[3,33,33,33,33,33,3,33,33,33,33,33,33,33,33,33,33,33,33,33,54,56,33,]),'NOT':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,59,],[5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,]),'!':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,59,],[6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,]),'MINUS':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[7,-31,27,7,7,7,-35,7,-26,-32,-33,-34,-36,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,27,-31,27,-24,27,27,27,27,27,27,27,27,27,27,27,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,7,]),'LPAREN':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,59,],[9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,]),'TRUE':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,59,],[11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,]),'FALSE':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,59,],[12,12,12,12,12,12,12,12,12,12,12,12,12,12,12,12,12,12,12,12,12,]),'NUMBER':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,59,],[13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,13,]),'STRING':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,59,],[14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,14,]),'GT':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,18,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,18,-31,18,-24,18,18,18,-8,-9,-10,-11,18,18,18,18,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'LT':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,19,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,19,-31,19,-24,19,19,19,-8,-9,-10,-11,19,19,19,19,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'GE':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,20,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,20,-31,20,-24,20,20,20,-8,-9,-10,-11,20,20,20,20,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'LE':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,21,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,21,-31,21,-24,21,21,21,-8,-9,-10,-11,21,21,21,21,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'EQ':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,22,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,22,-31,22,-24,22,22,22,-8,-9,-10,-11,-12,-13,22,22,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'NE':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,23,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,23,-31,23,-24,23,23,23,-8,-9,-10,-11,-12,-13,23,23,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'AND':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,24,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,24,-31,24,-24,24,24,24,-8,-9,-10,-11,-12,-13,-14,24,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'OR':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,25,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,25,-31,25,-24,25,25,25,-8,-9,-10,-11,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'PLUS':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,26,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,26,-31,26,-24,26,26,26,26,26,26,26,26,26,26,26,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'TIMES':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,28,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,28,-31,28,-24,28,28,28,28,28,28,28,28,28,28,28,28,28,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'DIVIDE':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,29,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,29,-31,29,-24,29,29,29,29,29,29,29,29,29,29,29,29,29,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'IN':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,30,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-6,-31,30,-24,30,30,30,-8,-9,-10,-11,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'SUBSET':([0,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,38,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-31,31,-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-6,-31,31,-24,31,31,31,-8,-9,-10,-11,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'SQ_LPAREN':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,31,59,],[15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,15,]),'EQUALS':([3,],[17,]),'RPAREN':([5,6,7,8,9,10,11,12,13,14,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,36,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,],[-37,-37,-37,-35,-37,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-6,-31,-7,-24,57,-8,-9,-10,-11,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,]),'COMMA':([5,6,7,8,10,11,12,13,14,15,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,38,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,],[-37,-37,-37,-35,-26,-32,-33,-34,-36,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-6,-31,-7,-24,59,-8,-9,-10,-11,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-37,]),'SQ_RPAREN':([5,6,7,8,10,11,12,13,14,15,18,19,20,21,22,23,24,25,26,27,28,29,32,33,34,35,37,38,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,60,],[-37,-37,-37,-35,-26,-32,-33,-34,-36,-28,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-37,-6,-31,-7,-24,58,-29,-8,-9,-10,-11,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-25,-27,-28,-30,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'kwl':([0,16,],[1,39,]),'statement':([0,16,],[2,2,]),'expression':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,59,],[4,32,34,35,36,38,4,40,41,42,43,44,45,46,47,48,49,50,51,52,38,]),'lexp':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,31,59,],[8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,53,55,8,]),'term':([0,5,6,7,9,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,59,],[10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,]),'l':([15,59,],[37,60,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> kwl","S'",1,None,None,None),
+  ('kwl -> statement','kwl',1,'p_kwl_statement','evaluate.py',1560),
+  ('kwl -> <empty>','kwl',0,'p_kwl_empty','evaluate.py',1566),
+  ('kwl -> kwl SEPARATOR kwl','kwl',3,'p_kwl_kwl','evaluate.py',1572),
+  ('statement -> VAR EQUALS expression','statement',3,'p_statement_assign','evaluate.py',1578),
+  ('statement -> expression','statement',1,'p_statement_expr','evaluate.py',1584),
+  ('expression -> NOT expression','expression',2,'p_statement_notexpr','evaluate.py',1590),
+  ('expression -> ! expression','expression',2,'p_statement_notexpr','evaluate.py',1591),
+  ('expression -> expression GT expression','expression',3,'p_expression_boolop','evaluate.py',1598),
+  ('expression -> expression LT expression','expression',3,'p_expression_boolop','evaluate.py',1599),
+  ('expression -> expression GE expression','expression',3,'p_expression_boolop','evaluate.py',1600),
+  ('expression -> expression LE expression','expression',3,'p_expression_boolop','evaluate.py',1601),
+  ('expression -> expression EQ expression','expression',3,'p_expression_boolop','evaluate.py',1602),
+  ('expression -> expression NE expression','expression',3,'p_expression_boolop','evaluate.py',1603),
+  ('expression -> expression AND expression','expression',3,'p_expression_boolop','evaluate.py',1604),
+  ('expression -> expression OR expression','expression',3,'p_expression_boolop','evaluate.py',1605),
+  ('expression -> expression PLUS expression','expression',3,'p_expression_binop','evaluate.py',1612),
+  ('expression -> expression MINUS expression','expression',3,'p_expression_binop','evaluate.py',1613),
+  ('expression -> expression TIMES expression','expression',3,'p_expression_binop','evaluate.py',1614),
+  ('expression -> expression DIVIDE expression','expression',3,'p_expression_binop','evaluate.py',1615),
+  ('expression -> expression IN lexp','expression',3,'p_expression_inlist','evaluate.py',1621),
+  ('expression -> expression IN VAR','expression',3,'p_expression_invar','evaluate.py',1627),
+  ('expression -> expression SUBSET lexp','expression',3,'p_expression_subsetlist','evaluate.py',1633),
+  ('expression -> expression SUBSET VAR','expression',3,'p_expression_subsetvar','evaluate.py',1639),
+  ('expression -> MINUS expression','expression',2,'p_expression_uminus','evaluate.py',1645),
+  ('expression -> LPAREN expression RPAREN','expression',3,'p_expression_group','evaluate.py',1652),
+  ('expression -> term','expression',1,'p_expression_term','evaluate.py',1659),
+  ('lexp -> SQ_LPAREN l SQ_RPAREN','lexp',3,'p_lexp_def','evaluate.py',1672),
+  ('l -> <empty>','l',0,'p_l_empty','evaluate.py',1678),
+  ('l -> expression','l',1,'p_l_expression','evaluate.py',1685),
+  ('l -> expression COMMA l','l',3,'p_l_comma_l','evaluate.py',1692),
+  ('term -> VAR','term',1,'p_term_var','evaluate.py',1699),
+  ('term -> TRUE','term',1,'p_term_bool','evaluate.py',1705),
+  ('term -> FALSE','term',1,'p_term_bool','evaluate.py',1706),
+  ('term -> NUMBER','term',1,'p_term_num','evaluate.py',1713),
+  ('term -> lexp','term',1,'p_term_lexp','evaluate.py',1720),
+  ('term -> STRING','term',1,'p_term_string','evaluate.py',1727),
+  ('term -> <empty>','term',0,'p_term_empty','evaluate.py',1734),
+]
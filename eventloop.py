@@ -20,6 +20,22 @@
 from . import log
 import time
 import threading
+import heapq
+import bisect
+try:
+    import queue
+except:
+    import Queue as queue
+import pickle
+import zlib
+
+# concurrent.futures is part of Python 3; in Python 2 it is provided by the package "futures". If it is
+#   not available, the threaded callbacks have no future and the callbacks cannot be run in processes.
+try:
+    from concurrent.futures import Future, ProcessPoolExecutor
+    _futures_available = True
+except:
+    _futures_available = False
 _LOGGER = log.Log("ELOOP")
 
 def create_eventloop(rt = True):
@@ -52,9 +68,188 @@ def now():
         _NOW = _eventloop.time()
     return _NOW
 
+def _new_future():
+    # Returns a new future for the result of a callback (or None if concurrent.futures is not available)
+    if _futures_available:
+        return Future()
+    return None
+
+def _check_futures():
+    if not _futures_available:
+        raise Exception("running callbacks in processes needs concurrent.futures (package futures in Python 2)")
+
+def _run_callback(future, callback, parameters):
+    # Executes the callback and stores its result (or the exception raised) in the future, if any
+    if (future is not None) and not future.set_running_or_notify_cancel():
+        return
+    try:
+        retval = callback(*parameters)
+    except Exception as e:
+        _LOGGER.error("error executing callback %s: %s" % (callback, e))
+        if future is not None:
+            future.set_exception(e)
+        return
+    if future is not None:
+        future.set_result(retval)
+
+class WorkerPool(object):
+    '''
+    This class is a pool of threads that execute the callbacks of the events that are executed in a
+      thread. The threads are started as they are needed (up to max_workers), and the callbacks wait
+      in a queue of queue_size items. If the queue is full, the callback is executed according to
+      the overflow policy: the caller waits for room in the queue (OVERFLOW_BLOCK), the callback is
+      not executed and its future is cancelled (OVERFLOW_DROP) or the callback is executed in the
+      thread of the caller (OVERFLOW_INLINE).
+    '''
+    OVERFLOW_BLOCK = 0
+    OVERFLOW_DROP = 1
+    OVERFLOW_INLINE = 2
+
+    def __init__(self, max_workers = 8, queue_size = 64, overflow = OVERFLOW_BLOCK):
+        self._lock = threading.Lock()
+        self._max_workers = max_workers
+        self._overflow = overflow
+        self._queue = queue.Queue(queue_size)
+        self._workers = []
+        self._pending = 0
+        self._shutdown = False
+        self.dropped = 0
+        self.inlined = 0
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            (future, callback, parameters) = item
+            _run_callback(future, callback, parameters)
+            self._lock.acquire()
+            self._pending -= 1
+            self._lock.release()
+
+    def submit(self, callback, parameters = []):
+        # Programs the execution of the callback in the pool and returns the future of its result (None if
+        #   concurrent.futures is not available)
+        future = _new_future()
+        item = (future, callback, parameters)
+
+        self._lock.acquire()
+        if self._shutdown:
+            self._lock.release()
+            raise Exception("the worker pool has been shut down")
+        if (self._pending >= len(self._workers)) and (len(self._workers) < self._max_workers):
+            th = threading.Thread(target = self._worker)
+            th.daemon = True
+            th.start()
+            self._workers.append(th)
+        self._pending += 1
+        self._lock.release()
+
+        if self._overflow == WorkerPool.OVERFLOW_BLOCK:
+            self._queue.put(item)
+            return future
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._lock.acquire()
+            self._pending -= 1
+            self._lock.release()
+            if self._overflow == WorkerPool.OVERFLOW_DROP:
+                self.dropped += 1
+                _LOGGER.warning("the queue of the worker pool is full: callback %s dropped" % callback)
+                if future is not None:
+                    future.cancel()
+            else:
+                self.inlined += 1
+                _run_callback(future, callback, parameters)
+        return future
+
+    def pending(self):
+        # Returns the number of callbacks that are waiting or being executed
+        return self._pending
+
+    def shutdown(self, wait = True):
+        # Stops the threads of the pool once they have executed the callbacks in the queue
+        self._lock.acquire()
+        self._shutdown = True
+        workers = self._workers
+        self._workers = []
+        self._lock.release()
+        for _ in workers:
+            self._queue.put(None)
+        if wait:
+            for th in workers:
+                th.join()
+
+def set_worker_pool(pool):
+    # Sets the pool of threads that execute the threaded callbacks of the events. If it is None, each
+    #   callback is executed in a new thread.
+    global _worker_pool
+    _worker_pool = pool
+
+def get_worker_pool():
+    return _worker_pool
+
+_worker_pool = None
+
+def _run_in_thread(callback, parameters):
+    # Executes the callback in the worker pool (or in a new thread) and returns the future of its result
+    #   (None if concurrent.futures is not available)
+    if _worker_pool is not None:
+        return _worker_pool.submit(callback, parameters)
+    future = _new_future()
+    th = threading.Thread(target = _run_callback, args = (future, callback, parameters))
+    th.start()
+    return future
+
+def set_process_pool(pool):
+    # Sets the executor (e.g. a ProcessPoolExecutor) in which the callbacks of the events that are
+    #   executed in a process are run
+    global _process_pool
+    _process_pool = pool
+
+def get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        _check_futures()
+        _process_pool = ProcessPoolExecutor()
+    return _process_pool
+
+_process_pool = None
+
+def register_callback(name, callback):
+    # Registers a callback with a name, so that the events that use it can be stored in a snapshot of
+    #   the eventloop (the same name must be registered when the snapshot is restored)
+    _callbacks[name] = callback
+
+def unregister_callback(name):
+    if name in _callbacks:
+        del _callbacks[name]
+
+_callbacks = {}
+
+def _callback_name(callback):
+    if callback is None:
+        return None
+    # the callbacks are compared by equality because the bound methods are new objects each time that they are accessed
+    for name, registered in _callbacks.items():
+        if registered == callback:
+            return name
+    raise Exception("callback %s is not registered" % callback)
+
+def _callback_from_name(name):
+    if name is None:
+        return None
+    if name not in _callbacks:
+        raise Exception("callback %s is not registered" % name)
+    return _callbacks[name]
+
 class Event_Generic(object):
     '''
     This is the base class for the definition of one event.
+    If the callback is executed in a thread or in a process, the future of its result in the last
+      call is stored in the future attribute.
     '''
     _id = -1
     
@@ -82,23 +277,55 @@ class Event_Generic(object):
         self.mute = mute
         self.lastcall = None
         self.threaded_callback = threaded_callback
+        self.process_callback = False
+        self.on_completion = None
+        self.future = None
+        self._eventloop = None
 
     def execute_callback_in_thread(self, execute_callback_in_thread = True):
         self.threaded_callback = execute_callback_in_thread
 
+    def execute_callback_in_process(self, execute_callback_in_process = True, on_completion = None):
+        # The callback will be executed in the process pool (so it and its parameters must be picklable),
+        #   and the function on_completion will be called in the eventloop with the value returned by
+        #   the callback, by means of a new event
+        self.process_callback = execute_callback_in_process
+        self.on_completion = on_completion
+
+    def _process_completed(self, future):
+        # Programs the event that delivers the result of the callback executed in the process pool
+        if future.cancelled():
+            return
+        e = future.exception()
+        if e is not None:
+            _LOGGER.error("error executing callback %s in a process: %s" % (self.callback, e))
+            return
+        if self.on_completion is not None:
+            eventloop = self._eventloop
+            if eventloop is None:
+                eventloop = get_eventloop()
+            eventloop.add_event(Event(0, callback = self.on_completion, parameters = [ future.result() ], description = "completion of %s" % self.description, priority = self.priority, mute = self.mute))
+
     def call(self, now):
-        # This method executes the event. If there is a callback, it will be executed
+        # This method executes the event. If there is a callback, it will be executed (and, if it is
+        #   executed in the thread of the eventloop, the value that it returns is returned)
         self.lastcall = now
         
         if not self.mute:
             _LOGGER.debug("(@%.4f) executing event (%s) %s - time %.2f" % (now, self.id, self.description, self.t))
 
         if self.callback is not None:
-            if self.threaded_callback:
-                th = threading.Thread(target=self.callback,args=self.parameters)
-                th.start()
+            if self.process_callback:
+                self.future = get_process_pool().submit(self.callback, *self.parameters)
+                self.future.add_done_callback(self._process_completed)
+            elif self.threaded_callback:
+                if self._eventloop is not None:
+                    self.future = self._eventloop._run_in_thread(self.callback, self.parameters)
+                else:
+                    self.future = _run_in_thread(self.callback, self.parameters)
             else:
-                self.callback(*self.parameters)
+                return self.callback(*self.parameters)
+        return None
             
     def next_sched(self, now):
         # This method returns the next time in which the event should be executed. If the event
@@ -109,6 +336,8 @@ class Event_Generic(object):
     def reprogram(self, t = None):
         # This method is set to change the programmation of the next execution of the event
         self.__set_t(t)
+        if self._eventloop is not None:
+            self._eventloop._reprogram_event(self)
 
     def __set_t(self, t):
         # We are truncating to milliseconds in order to avoid artifacts such as programming
@@ -135,8 +364,9 @@ class Event_Periodical(Event_Generic):
 
     def call(self, now):
         # The event will be called as usual, but it will be reprogrammed to be repeated according to the period of time
-        Event_Generic.call(self, now)
+        retval = Event_Generic.call(self, now)
         self.reprogram(self.t + self.repeat)
+        return retval
         
 class Event(Event_Generic):
     '''
@@ -163,14 +393,305 @@ class Event_Simple(Event):
     def __init__(self, t, description, mute = False):
         Event.__init__(self, t, callback = None, description = description, parameters = [], priority = Event_Generic.PRIO_NORMAL, mute = mute, threaded_callback = False)        
 
+class _EventHeap(object):
+    '''
+    This class is the default scheduler of the eventloop: the entries (time, priority, sequence, event_id)
+        of the programmation of the events are kept in a heap. The entries that become obsolete are not
+        removed, but they are discarded by the eventloop when they reach the top of the heap.
+    '''
+    def __init__(self):
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, entry):
+        heapq.heappush(self._heap, entry)
+
+    def discard(self, entry):
+        # The entry is removed lazily
+        pass
+
+    def peek(self):
+        if len(self._heap) == 0:
+            return None
+        return self._heap[0]
+
+    def pop(self):
+        return heapq.heappop(self._heap)
+
+    def entries(self):
+        return list(self._heap)
+
+    def compact(self, valid):
+        # Removes the entries that are not valid (according to the function valid)
+        self._heap = [ entry for entry in self._heap if valid(entry) ]
+        heapq.heapify(self._heap)
+
+class _EventDict(object):
+    '''
+    This class is a scheduler that keeps the entries of the events in a dictionary, and searches the
+        first one each time that it is needed (as the eventloop used to do). The insertions and
+        cancellations are O(1), but obtaining the next event is O(n).
+    '''
+    def __init__(self):
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def push(self, entry):
+        self._entries[entry[3]] = entry
+
+    def discard(self, entry):
+        if self._entries.get(entry[3]) is entry:
+            del self._entries[entry[3]]
+
+    def peek(self):
+        if len(self._entries) == 0:
+            return None
+        return min(self._entries.values())
+
+    def pop(self):
+        entry = self.peek()
+        del self._entries[entry[3]]
+        return entry
+
+    def entries(self):
+        return list(self._entries.values())
+
+    def compact(self, valid):
+        pass
+
+class _TimingWheel(object):
+    '''
+    This class is a scheduler based on a hierarchical timing wheel: there are several levels of wheels
+        with 2^bits slots, and each slot of a level spans the whole wheel of the level below. The time
+        of each entry is converted to ticks, and the entry is stored in the slot of the lowest level
+        that will be reached by the cursor before the tick (or in an overflow bucket, if the tick is
+        beyond the highest level). When the cursor reaches one slot, its entries are moved to the lower
+        levels and, at the end, to a heap of entries that are ready to be executed.
+    The insertions and cancellations are O(1) and the order of the entries is exactly the same than in
+        the heap, as the tick resolution only affects to the number of entries that are moved together.
+    '''
+    def __init__(self, tick = 0.01, bits = 8, levels = 4):
+        self._tick = float(tick)
+        self._bits = bits
+        self._slots = 1 << bits
+        self._mask = self._slots - 1
+        self._levels = levels
+        self._wheels = [ [ {} for _ in range(self._slots) ] for _ in range(levels) ]
+        self._overflow = {}
+        self._buckets = {}
+        self._ready = []
+        self._current = None
+
+    def __len__(self):
+        return len(self._buckets) + len(self._ready)
+
+    def push(self, entry):
+        tick = int(entry[0] // self._tick)
+        if self._current is None:
+            self._current = tick
+        if tick <= self._current:
+            heapq.heappush(self._ready, entry)
+            return
+
+        bucket = self._overflow
+        for level in range(self._levels):
+            shift = self._bits * (level + 1)
+            if (tick >> shift) == (self._current >> shift):
+                bucket = self._wheels[level][(tick >> (shift - self._bits)) & self._mask]
+                break
+        bucket[entry[3]] = entry
+        self._buckets[entry[3]] = bucket
+
+    def discard(self, entry):
+        # The entries in the wheels are removed; the entries that are ready are removed lazily
+        event_id = entry[3]
+        bucket = self._buckets.get(event_id)
+        if (bucket is not None) and (bucket.get(event_id) is entry):
+            del bucket[event_id]
+            del self._buckets[event_id]
+
+    def _cascade(self, bucket):
+        # Distributes the entries of one bucket that has been reached by the cursor
+        for event_id, entry in list(bucket.items()):
+            del self._buckets[event_id]
+            self.push(entry)
+
+    def _advance(self):
+        # Moves the cursor to the next slot that contains entries. Returns False if the wheels are empty.
+        if len(self._buckets) == 0:
+            return False
+
+        current = self._current
+        for level in range(self._levels):
+            shift = self._bits * level
+            wheel = self._wheels[level]
+            for i in range(((current >> shift) & self._mask) + 1, self._slots):
+                if len(wheel[i]) > 0:
+                    upper = shift + self._bits
+                    self._current = ((current >> upper) << upper) | (i << shift)
+                    bucket = wheel[i]
+                    wheel[i] = {}
+                    self._cascade(bucket)
+                    return True
+
+        # The wheels are empty, so the cursor jumps to the range of the first entry in the overflow bucket
+        span = self._bits * self._levels
+        tick = min([ int(entry[0] // self._tick) for entry in self._overflow.values() ])
+        self._current = (tick >> span) << span
+        bucket = self._overflow
+        self._overflow = {}
+        self._cascade(bucket)
+        return True
+
+    def peek(self):
+        while len(self._ready) == 0:
+            if not self._advance():
+                return None
+        return self._ready[0]
+
+    def pop(self):
+        self.peek()
+        return heapq.heappop(self._ready)
+
+    def entries(self):
+        return [ bucket[event_id] for event_id, bucket in self._buckets.items() ] + self._ready
+
+    def compact(self, valid):
+        self._ready = [ entry for entry in self._ready if valid(entry) ]
+        heapq.heapify(self._ready)
+
+class EventLoopMetrics(object):
+    '''
+    This class gathers the metrics of the execution of the events in an eventloop: the histogram of the
+      delay between the time in which each event was programmed and the time in which it is executed,
+      the number of calls and the duration of the callbacks (grouped by the description of the events,
+      up to MAX_DESCRIPTIONS different ones), the number of events in the eventloop and the number of
+      callbacks that are being executed in threads, processes or coroutines. When the metrics are not
+      enabled in the eventloop, the only cost is checking whether they are enabled or not.
+    If log_period is set, the metrics are logged when an event is executed and log_period seconds (of
+      the eventloop) have passed since the last time that they were logged. It is checked here instead
+      of using an event so that the metrics do not alter the programmation of the eventloop.
+    '''
+    DELAY_BUCKETS = [ 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60 ]
+    MAX_DESCRIPTIONS = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.log_period = None
+        self._next_log = None
+        self.dispatched = 0
+        self.delays = [ 0 ] * (len(self.DELAY_BUCKETS) + 1)
+        self.total_delay = 0.0
+        self.max_delay = 0.0
+        self.callbacks = {}
+        self.max_queue_depth = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def set_log_period(self, log_period, now):
+        # Sets the period to log the metrics (None to stop logging them), starting at time now
+        self.log_period = log_period
+        self._next_log = None
+        if log_period is not None:
+            self._next_log = now + log_period
+
+    def _callback_executed(self, description, elapsed):
+        self._lock.acquire()
+        stats = self.callbacks.get(description)
+        if stats is None:
+            if len(self.callbacks) >= self.MAX_DESCRIPTIONS:
+                description = "(other)"
+                stats = self.callbacks.get(description)
+            if stats is None:
+                stats = self.callbacks[description] = [ 0, 0.0, 0.0 ]
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+        self._lock.release()
+
+    def call_event(self, eventloop, event, now):
+        # Executes the event in the eventloop, gathering its metrics
+        delay = max(0, eventloop.time() - event.t)
+        self.dispatched += 1
+        self.delays[bisect.bisect_left(self.DELAY_BUCKETS, delay)] += 1
+        self.total_delay += delay
+        if delay > self.max_delay:
+            self.max_delay = delay
+        if len(eventloop.events) > self.max_queue_depth:
+            self.max_queue_depth = len(eventloop.events)
+
+        future = event.future
+        t0 = time.time()
+        eventloop._execute_event(event, now)
+        if (event.future is None) or (event.future is future):
+            self._callback_executed(event.description, time.time() - t0)
+        elif not event.future.done():
+            # The callback is being executed in a thread, a process or a coroutine
+            self._lock.acquire()
+            self.in_flight += 1
+            if self.in_flight > self.max_in_flight:
+                self.max_in_flight = self.in_flight
+            self._lock.release()
+            description = event.description
+            event.future.add_done_callback(lambda _: self._callback_finished(description, t0))
+        else:
+            # The callback has been executed in a thread, a process or a coroutine that has already finished
+            self._callback_executed(event.description, time.time() - t0)
+
+        if (self._next_log is not None) and (now >= self._next_log):
+            self._next_log += self.log_period * (int((now - self._next_log) / self.log_period) + 1)
+            eventloop._log_metrics()
+
+    def _callback_finished(self, description, t0):
+        self._lock.acquire()
+        self.in_flight -= 1
+        self._lock.release()
+        self._callback_executed(description, time.time() - t0)
+
+    def get(self, eventloop = None):
+        # Returns a dict with the metrics
+        self._lock.acquire()
+        callbacks = dict([ (description, { "calls": calls, "total_time": total, "max_time": maximum }) for (description, (calls, total, maximum)) in self.callbacks.items() ])
+        in_flight = self.in_flight
+        self._lock.release()
+        return {
+            "dispatched": self.dispatched,
+            "delay": {
+                "histogram": list(zip(self.DELAY_BUCKETS + [ None ], self.delays)),
+                "mean": self.total_delay / self.dispatched if self.dispatched > 0 else 0.0,
+                "max": self.max_delay
+            },
+            "callbacks": callbacks,
+            "queue_depth": len(eventloop.events) if eventloop is not None else None,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": in_flight,
+            "max_in_flight": self.max_in_flight
+        }
+
 class _EventLoop(object):
     '''
     This class is used to implement a generic event loop that runs on time-steps. The time
         is simmulated and the eventloop just advances to the next event in the eventloop.
+    The programmation of the events is kept in a scheduler (by default, an _EventHeap) as entries
+        (time, priority, sequence, event_id), where the sequence is the order in which the events were
+        added (so events with the same time and priority are executed in that order). The entries of the
+        events that have been cancelled or reprogrammed may remain in the scheduler, but they are
+        discarded when they reach the top of it (the valid entry for each event is the one stored in
+        _scheduled).
     '''
     def __init__(self):
         self._lock = threading.Lock()
         self.events = {}
+        self._queue = _EventHeap()
+        self._scheduled = {}
+        self._sequence = {}
+        self._seq = 0
+        self._nonperiodical_events = 0
         self.t = 0
         self.t = self.time()
         self._walltime = None
@@ -179,6 +700,34 @@ class _EventLoop(object):
         self._current_periodical_events = 10
         self._limit_new_events_time = None
         self._timestamp_last_nonperiodical_event = None
+        self._metrics = None
+
+    def enable_metrics(self, log_period = None):
+        # Starts gathering the metrics of the execution of the events (see EventLoopMetrics). If log_period
+        #   is set, the metrics are logged each log_period seconds (of the eventloop).
+        if self._metrics is None:
+            self._metrics = EventLoopMetrics()
+        self._metrics.set_log_period(log_period, self.time())
+        return self._metrics
+
+    def disable_metrics(self):
+        # Stops gathering the metrics. Returns the metrics gathered so far
+        metrics = self._metrics
+        self._metrics = None
+        return metrics
+
+    def get_metrics(self):
+        # Returns a dict with the metrics of the eventloop (or None if they are not enabled)
+        metrics = self._metrics
+        if metrics is None:
+            return None
+        return metrics.get(self)
+
+    def _log_metrics(self):
+        metrics = self.get_metrics()
+        if metrics is not None:
+            _LOGGER.info("metrics: dispatched %d events, delay mean %.4f max %.4f, queue depth %d (max %d), callbacks in flight %d (max %d)" % (
+                metrics["dispatched"], metrics["delay"]["mean"], metrics["delay"]["max"], metrics["queue_depth"], metrics["max_queue_depth"], metrics["in_flight"], metrics["max_in_flight"]))
 
     def limit_time_without_new_events(self, limit):
         # This method is used to limit the times in which no new events appear. This mechanism introduce the ability to finalize one application in which new events do not happen.
@@ -202,6 +751,16 @@ class _EventLoop(object):
     def time(self):
         # This method returns the time, according to the event loop
         return self.t
+
+    def set_scheduler(self, scheduler):
+        # This method sets the scheduler that keeps the programmation of the events (e.g. a _TimingWheel
+        #   for eventloops with huge amounts of events). The events already programmed are moved to it.
+        self._lock.acquire()
+        for entry in self._queue.entries():
+            if self._scheduled.get(entry[3]) is entry:
+                scheduler.push(entry)
+        self._queue = scheduler
+        self._lock.release()
     
     def add_event(self, event):
         self._lock.acquire()
@@ -215,47 +774,123 @@ class _EventLoop(object):
             raise Exception("An event with id %s already exists" % event.id)
 
         now = self.time()
+        event._eventloop = None
         event.reprogram(event.t + now)
+        event._eventloop = self
         self.events[event.id] = event
+        self._seq += 1
+        self._sequence[event.id] = self._seq
+        if not isinstance(event, Event_Periodical):
+            self._nonperiodical_events += 1
+        self._push_event(event, event.t)
         self._lock.release()
         return event
 
     def cancel_event(self, event_id):
         # This method cancels one event, by using its id. Returns True if the event was cancelled. Otherwise
         #   it returns False.
-        result = False
         self._lock.acquire()
-        if event_id in self.events:
-            del self.events[event_id]
-            result = True
+        result = self._forget_event(event_id)
         self._lock.release()
-        return False
-    
-    def _sort_events(self, now):
-        # This method is used to obtain the programmation of the execution of the events in the order of
-        #   happening. Moreover this method also purges all these events that will not be executed anymore
-        # It returns a list of pairs (event_id, program_time) that correspond to the each of the events
-        #   that should be executed in the future.
-        forgotten_events = []
-        nexteventsqueue = []
+        return result
 
+    def _reprogram_event(self, event):
+        # Programs again one event of the eventloop whose time has been changed (by means of its method
+        #   reprogram), so that it is executed at its new time even if it is earlier than the previous one
         self._lock.acquire()
-        for event_id, event in list(self.events.items()):
+        if (self.events.get(event.id) is event) and (event.id in self._scheduled):
+            next_sched = event.next_sched(self.time())
+            if next_sched is not None:
+                self._push_event(event, next_sched)
+        self._lock.release()
+
+    def _push_event(self, event, t):
+        # Programs the event to be executed at time t (the lock must be acquired). Any previous entry
+        #   of the event in the scheduler becomes obsolete.
+        previous = self._scheduled.get(event.id)
+        if previous is not None:
+            self._queue.discard(previous)
+        entry = (t, event.priority, self._sequence[event.id], event.id)
+        self._scheduled[event.id] = entry
+        self._queue.push(entry)
+
+    def _forget_event(self, event_id):
+        # Removes the event from the eventloop (the lock must be acquired). Its entries in the scheduler
+        #   may be discarded when they are popped, but they are purged if there are too many of them.
+        if event_id not in self.events:
+            return False
+        event = self.events.pop(event_id)
+        self._queue.discard(self._scheduled.pop(event_id))
+        del self._sequence[event_id]
+        if not isinstance(event, Event_Periodical):
+            self._nonperiodical_events -= 1
+        if len(self._queue) > 2 * len(self._scheduled) + 64:
+            self._queue.compact(lambda entry: self._scheduled.get(entry[3]) is entry)
+        return True
+
+    def _next_event(self, now):
+        # Returns the tuple (event, program_time, entry) of the next event to be executed, or None if there
+        #   are not events (the lock must be acquired). The obsolete entries at the top of the scheduler are
+        #   discarded, the events that will not be executed anymore are purged and the events that have
+        #   been reprogrammed are pushed again. If the time of the event has passed, its entry is popped
+        #   from the scheduler because it is going to be executed.
+        queue = self._queue
+        entry = queue.peek()
+        while entry is not None:
+            (t, priority, _, event_id) = entry
+            if self._scheduled.get(event_id) is not entry:
+                queue.pop()
+            else:
+                event = self.events[event_id]
+                next_sched = event.next_sched(now)
+                if next_sched is None:
+                    queue.pop()
+                    self._forget_event(event_id)
+                elif (next_sched != t) or (event.priority != priority):
+                    queue.pop()
+                    self._push_event(event, next_sched)
+                else:
+                    if t <= now:
+                        queue.pop()
+                    return (event, t, entry)
+            entry = queue.peek()
+        return None
+
+    def _dispatch_event(self, event, entry, now):
+        # Executes the event (whose entry has already been popped from the scheduler) and programs its next
+        #   execution, if the event has not been cancelled or reprogrammed during its execution
+        self._call_event(event, now)
+
+        self._lock.acquire()
+        if self._scheduled.get(event.id) is entry:
             next_sched = event.next_sched(now)
             if next_sched is None:
-                forgotten_events.append(event_id)
+                self._forget_event(event.id)
             else:
-                nexteventsqueue.append((event_id, next_sched, event.priority))
-                
-        # Order according to 1: the time, 2: priority
-        nexteventsqueue.sort(key = lambda x: (x[1], x[2]))
+                self._push_event(event, next_sched)
         self._lock.release()
 
-        # Clean the events that are not being executed anymore
-        for event_id in forgotten_events:
-            self.cancel_event(event_id)
-        
-        return [ (x,y) for (x, y, _) in nexteventsqueue ]
+    def _call_event(self, event, now):
+        if self._metrics is None:
+            self._execute_event(event, now)
+        else:
+            self._metrics.call_event(self, event, now)
+
+    def _execute_event(self, event, now):
+        event.call(now)
+
+    def _run_in_thread(self, callback, parameters):
+        # Executes a threaded callback of an event and returns the future of its result
+        return _run_in_thread(callback, parameters)
+
+    def _sort_events(self, now):
+        # This method is used to obtain the programmation of the execution of the events in the order of
+        #   happening. It returns a list of pairs (event_id, program_time) that correspond to the each of
+        #   the events that should be executed in the future.
+        self._lock.acquire()
+        nexteventsqueue = sorted([ entry for entry in self._queue.entries() if self._scheduled.get(entry[3]) is entry ])
+        self._lock.release()
+        return [ (event_id, t) for (t, _, _, event_id) in nexteventsqueue ]
     
     def _progress_to_time(self, t):
         # This method is used to make the time advance in order to be more near to one time
@@ -263,45 +898,50 @@ class _EventLoop(object):
         self.t = t
         self._lock.release()
 
+    def _limits_reached(self, now):
+        # Returns True if the eventloop has to finish because of the walltime or because of the time without
+        #   new events
+        if (self._walltime is not None) and (now > self._walltime):
+            _LOGGER.info("walltime %.2f achieved" % self._walltime)
+            return True
+
+        if not self._endless_loop:
+            if self._nonperiodical_events > 0:
+                self._lock.acquire()
+                self._timestamp_last_nonperiodical_event = now
+                self._lock.release()
+
+            if (self._limit_new_events_time is not None):
+                elapsed = 0
+                
+                self._lock.acquire()
+                if self._timestamp_last_nonperiodical_event is not None:
+                    elapsed = now - self._timestamp_last_nonperiodical_event
+                    
+                self._lock.release()
+                if elapsed > self._limit_new_events_time:
+                    _LOGGER.info("limit of time without new events reached")
+                    return True
+        return False
+
     def loop(self):
         # This is the main loop of events. The events will be executed in order, as long as the time in
         #   the eventloop arrives to them.
         while True:
             now = self.time()
-            if (self._walltime is not None) and (now > self._walltime):
-                _LOGGER.info("walltime %.2f achieved" % self._walltime)
+            if self._limits_reached(now):
                 break
-
-            if not self._endless_loop:
-                non_periodical = [ x for i, x in list(self.events.items()) if not isinstance(x, Event_Periodical)]
-                if len(non_periodical) > 0:
-                    self._lock.acquire()
-                    self._timestamp_last_nonperiodical_event = now
-                    self._lock.release()
-
-                if (self._limit_new_events_time is not None):
-                    elapsed = 0
-                    
-                    self._lock.acquire()
-                    if self._timestamp_last_nonperiodical_event is not None:
-                        elapsed = now - self._timestamp_last_nonperiodical_event
-                        
-                    self._lock.release()
-                    if elapsed > self._limit_new_events_time:
-                        _LOGGER.info("limit of time without new events reached")
-                        break
             
-            next_events = self._sort_events(now)
+            self._lock.acquire()
+            next_event = self._next_event(now)
+            self._lock.release()
                 
-            if len(next_events) > 0:
-                (ev_id, program_t ) = next_events[0]
+            if next_event is not None:
+                (ev, program_t, entry) = next_event
                 
                 # will execute the first event whose time has just passed
                 if program_t <= now:
-                    self._lock.acquire()
-                    ev = self.events[ev_id]
-                    self._lock.release()
-                    ev.call(now)
+                    self._dispatch_event(ev, entry, now)
                 else:
                     self._progress_to_time(program_t)
             else:
@@ -313,6 +953,73 @@ class _EventLoop(object):
                     _LOGGER.info("no more events")
                     break
                         
+    # Attributes of the events that are not stored in the snapshots
+    _TRANSIENT_ATTRIBUTES = [ "future", "_eventloop", "callback", "on_completion" ]
+
+    def snapshot(self):
+        # Returns the state of the eventloop (time, limits, programmed events and the counter of ids of the
+        #   events). The callbacks of the events must have been registered using register_callback. It is
+        #   intended for simulated eventloops, and it must not be called while the loop is running.
+        self._lock.acquire()
+        events = []
+        try:
+            for event_id, entry in self._scheduled.items():
+                event = self.events[event_id]
+                attributes = dict([ (k, v) for (k, v) in event.__dict__.items() if k not in self._TRANSIENT_ATTRIBUTES ])
+                events.append((entry, event.__class__, attributes, _callback_name(event.callback), _callback_name(event.on_completion)))
+        finally:
+            self._lock.release()
+        events.sort(key = lambda x: x[0][2])
+        return {
+            "t": self.t,
+            "walltime": self._walltime,
+            "endless_loop": self._endless_loop,
+            "limit_new_events_time": self._limit_new_events_time,
+            "timestamp_last_nonperiodical_event": self._timestamp_last_nonperiodical_event,
+            "seq": self._seq,
+            "event_id": Event._id,
+            "events": events
+        }
+
+    def restore(self, snapshot):
+        # Replaces the state of the eventloop by the one in the snapshot (obtained with the snapshot method)
+        self._lock.acquire()
+        for event_id in list(self.events.keys()):
+            self._forget_event(event_id)
+        self.t = snapshot["t"]
+        self._walltime = snapshot["walltime"]
+        self._endless_loop = snapshot["endless_loop"]
+        self._limit_new_events_time = snapshot["limit_new_events_time"]
+        self._timestamp_last_nonperiodical_event = snapshot["timestamp_last_nonperiodical_event"]
+        self._seq = max(self._seq, snapshot["seq"])
+        Event._id = max(Event._id, snapshot["event_id"])
+        try:
+            for ((t, _, seq, event_id), event_class, attributes, callback, on_completion) in snapshot["events"]:
+                event = event_class.__new__(event_class)
+                event.__dict__.update(attributes)
+                event.callback = _callback_from_name(callback)
+                event.on_completion = _callback_from_name(on_completion)
+                event.future = None
+                event._eventloop = self
+                self.events[event_id] = event
+                self._sequence[event_id] = seq
+                if not isinstance(event, Event_Periodical):
+                    self._nonperiodical_events += 1
+                self._push_event(event, t)
+        finally:
+            self._lock.release()
+
+    def save_snapshot(self, filename):
+        # Stores the snapshot of the eventloop in a (compressed) file
+        data = zlib.compress(pickle.dumps(self.snapshot(), pickle.HIGHEST_PROTOCOL))
+        with open(filename, "wb") as f:
+            f.write(data)
+
+    def load_snapshot(self, filename):
+        # Restores the state of the eventloop from a file created with save_snapshot
+        with open(filename, "rb") as f:
+            self.restore(pickle.loads(zlib.decompress(f.read())))
+
     def __str__(self):
         now = self.time()
         retval = "Current Time: %f, Pending Events: %d" % (now, len(self.events))
@@ -326,6 +1033,57 @@ class _EventLoop(object):
                 retval = "%s\n%s" % (retval, "+%s [%s]" % (when, ev.description))
         return retval
 
+class _EventLoop_TimingWheel(_EventLoop):
+    '''
+    This class is a simulated eventloop whose events are programmed in a hierarchical timing wheel,
+        intended for huge amounts of events that are mostly cancelled before they happen. Any other
+        eventloop can use a timing wheel by means of set_scheduler.
+    '''
+    def __init__(self, tick = 0.01, bits = 8, levels = 4):
+        _EventLoop.__init__(self)
+        self.set_scheduler(_TimingWheel(tick, bits, levels))
+
+class _EventLoop_Simulation(_EventLoop):
+    '''
+    This class is a simulated eventloop optimized to execute huge amounts of events: all the events
+        that happen at the same time are executed as a batch (the limits of the eventloop are checked
+        once per batch). The events are executed in the same order than in the _EventLoop, and they
+        can be added or cancelled from other threads (e.g. from threaded or process callbacks).
+    '''
+    def __init__(self, threaded = True):
+        # threaded is kept for compatibility: the eventloop is always locked, as the callbacks executed in
+        #   threads or processes may add events from other threads
+        _EventLoop.__init__(self)
+        self.dispatched = 0
+
+    def _run_batch(self, now):
+        # Executes the events whose time has passed. Returns the next event, as _next_event, which is
+        #   always programmed after now.
+        while True:
+            self._lock.acquire()
+            next_event = self._next_event(now)
+            self._lock.release()
+            if (next_event is None) or (next_event[1] > now):
+                return next_event
+            (ev, _, entry) = next_event
+            self._dispatch_event(ev, entry, now)
+            self.dispatched += 1
+
+    def loop(self):
+        while True:
+            now = self.t
+            if self._limits_reached(now):
+                break
+
+            next_event = self._run_batch(now)
+            if next_event is not None:
+                self._progress_to_time(next_event[1])
+            elif self._endless_loop:
+                self._progress_to_time(now + 1)
+            else:
+                _LOGGER.info("no more events")
+                break
+
 class _EventLoop_TimeStep(_EventLoop):
     '''
     This class is used to create an eventloop that advances in timesteps, instead of advancing
@@ -407,7 +1165,99 @@ class _EventLoop_RTT0(_EventLoop_RTT):
         #   substracting the init time in order to get the notion of a local time.
         return time.time() - self.t
             
+def _run_simulation(simulation, parameters, eventloop_class, snapshot):
+    # Runs one simulation of a sweep in a new eventloop, that is set as the global eventloop during the
+    #   simulation (the ids of the events and the time returned by now() start again in each one)
+    global _eventloop
+    global _NOW
+    (previous_eventloop, previous_now, previous_id) = (_eventloop, _NOW, Event._id)
+    t0 = time.time()
+    result = None
+    error = None
+    try:
+        Event._id = -1
+        _NOW = 0
+        eventloop = eventloop_class()
+        set_eventloop(eventloop)
+        if isinstance(snapshot, str):
+            eventloop.load_snapshot(snapshot)
+        elif snapshot is not None:
+            eventloop.restore(snapshot)
+        result = simulation(eventloop, parameters)
+        simulated_time = eventloop.time()
+    except Exception as e:
+        error = e
+        simulated_time = None
+    finally:
+        (_eventloop, _NOW, Event._id) = (previous_eventloop, previous_now, previous_id)
+    return { "parameters": parameters, "result": result, "error": error, "elapsed": time.time() - t0, "simulated_time": simulated_time }
+
+def run_sweep(simulation, parameters_list, workers = None, eventloop_class = _EventLoop_Simulation, snapshot = None):
+    # Runs one independent simulation for each of the parameters in parameters_list, in a pool of worker
+    #   processes. The function simulation(eventloop, parameters) receives a new eventloop (that is also
+    #   the global eventloop), which may start from a snapshot (a dict or the name of a file created
+    #   with save_snapshot), has to program the events and run the eventloop, and returns the result.
+    # The simulation function and the parameters must be picklable, and the callbacks needed by the
+    #   snapshot must be registered when the module of the simulation is imported.
+    # Returns a list with one dict for each simulation, with the keys parameters, result, error (the
+    #   exception raised by the simulation, if any), elapsed (the time needed to run it) and simulated_time.
+    _check_futures()
+    pool = ProcessPoolExecutor(max_workers = workers)
+    try:
+        futures = [ pool.submit(_run_simulation, simulation, parameters, eventloop_class, snapshot) for parameters in parameters_list ]
+        return [ future.result() for future in futures ]
+    finally:
+        pool.shutdown()
+
+def _benchmark_schedulers(n = 100000, cancelled = 0.9):
+    # Compares the schedulers when programming n timeouts (in the next hour), cancelling most of them
+    #   and running the eventloop until the rest of them have happened
+    import random
+    for name, scheduler, count in [ ("dict", _EventDict, n // 10), ("heap", _EventHeap, n), ("timing wheel", _TimingWheel, n) ]:
+        random.seed(0)
+        loop = _EventLoop()
+        loop.set_scheduler(scheduler())
+        loop.set_endless_loop(False)
+
+        t0 = time.time()
+        events = [ loop.add_event(Event(random.random() * 3600, mute = True)) for _ in range(count) ]
+        t1 = time.time()
+        for event in random.sample(events, int(count * cancelled)):
+            loop.cancel_event(event.id)
+        t2 = time.time()
+        loop.loop()
+        t3 = time.time()
+        print("%-12s %7d events: add %.2f us/event, cancel %.2f us/event, dispatch %.2f us/event" % (name, count, (t1 - t0) * 1e6 / count, (t2 - t1) * 1e6 / int(count * cancelled), (t3 - t2) * 1e6 / (count - int(count * cancelled))))
+
+def _benchmark_simulation(periodical = 1000, duration = 3600):
+    # Compares the generic eventloop and the simulation eventloop executing periodical events, that
+    #   also program one-shot events
+    import random
+    for name, eventloop_class in [ ("eventloop", _EventLoop), ("simulation", _EventLoop_Simulation) ]:
+        random.seed(0)
+        loop = eventloop_class()
+        counter = [ 0 ]
+        def callback():
+            counter[0] += 1
+            if counter[0] % 4 == 0:
+                loop.add_event(Event(random.randint(1, 60), callback = callback, mute = True))
+        for _ in range(periodical):
+            loop.add_event(Event_Periodical(random.randint(0, 60), random.choice([ 1, 5, 10, 30, 60 ]), callback = callback, mute = True))
+        loop.limit_walltime(duration)
+        t0 = time.time()
+        loop.loop()
+        elapsed = time.time() - t0
+        print("%-10s %d events in %.2f s (%.0f events/minute)" % (name, counter[0], elapsed, counter[0] * 60 / elapsed))
+
 if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark-schedulers":
+        _benchmark_schedulers()
+        exit()
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark-simulation":
+        _benchmark_simulation()
+        exit()
+
     def create_new_event():
         get_eventloop().add_event(Event(10, description = "event in second %.1f" % (get_eventloop().time() + 10.0)))
         
@@ -0,0 +1,146 @@
+# coding: utf-8
+#
+# CLUES Python utils - Utils and General classes that spin off from CLUES
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+# 
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import asyncio
+import threading
+from . import log
+from .eventloop import _EventLoop
+
+_LOGGER = log.Log("ELOOP")
+
+class _EventLoop_Asyncio(_EventLoop):
+    '''
+    This class is an eventloop that runs inside an asyncio loop: instead of waiting for the next event,
+        a timer of the asyncio loop (call_at) is programmed at the time of the first event, and it is
+        reprogrammed when new events are added (also from other threads). The time is the one of the
+        asyncio loop. The callbacks may be coroutines, that are run as tasks, and the threaded
+        callbacks are run in the executor of the asyncio loop, so they do not stall the I/O.
+    The eventloop can be run by means of loop() (that runs the asyncio loop until the eventloop
+        finishes) or it can be awaited from a running asyncio loop by means of run().
+    It needs Python 3, so it is kept apart from the module eventloop (which is Python 2 compatible).
+    '''
+    MAX_EVENTS_PER_STEP = 100
+
+    def __init__(self, loop = None, executor = None):
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = asyncio.new_event_loop()
+        self._aioloop = loop
+        self._executor = executor
+        self._handle = None
+        self._wakeup_pending = False
+        self._finished = None
+        self._thread_id = None
+        _EventLoop.__init__(self)
+
+    def time(self):
+        return self._aioloop.time()
+
+    def add_event(self, event):
+        ev = _EventLoop.add_event(self, event)
+        self._wakeup()
+        return ev
+
+    def _reprogram_event(self, event):
+        _EventLoop._reprogram_event(self, event)
+        self._wakeup()
+
+    def _wakeup(self):
+        # Makes the asyncio loop check the events again (if the eventloop is running)
+        if self._finished is None:
+            return
+        if threading.current_thread().ident == self._thread_id:
+            if not self._wakeup_pending:
+                self._wakeup_pending = True
+                self._aioloop.call_soon(self._step)
+        else:
+            self._aioloop.call_soon_threadsafe(self._step)
+
+    def _execute_event(self, event, now):
+        retval = event.call(now)
+        if asyncio.iscoroutine(retval):
+            event.future = self._aioloop.create_task(retval)
+            event.future.add_done_callback(self._callback_done)
+
+    def _run_in_thread(self, callback, parameters):
+        future = self._aioloop.run_in_executor(self._executor, callback, *parameters)
+        future.add_done_callback(self._callback_done)
+        return future
+
+    def _callback_done(self, future):
+        if (not future.cancelled()) and (future.exception() is not None):
+            _LOGGER.error("error executing callback: %s" % future.exception())
+
+    def _step(self):
+        # Executes the events whose time has passed and programs the timer for the next one
+        self._wakeup_pending = False
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if (self._finished is None) or self._finished.done():
+            return
+
+        for _ in range(self.MAX_EVENTS_PER_STEP):
+            now = self.time()
+            if self._limits_reached(now):
+                self._finished.set_result(None)
+                return
+
+            self._lock.acquire()
+            next_event = self._next_event(now)
+            self._lock.release()
+
+            if next_event is None:
+                if not self._endless_loop:
+                    _LOGGER.info("no more events")
+                    self._finished.set_result(None)
+                    return
+                t = None
+            else:
+                (ev, t, entry) = next_event
+                if t <= now:
+                    self._dispatch_event(ev, entry, now)
+                    continue
+
+            if (self._walltime is not None) and ((t is None) or (t > self._walltime)):
+                t = self._walltime
+            if t is not None:
+                self._handle = self._aioloop.call_at(t, self._step)
+            return
+
+        # Let the asyncio loop attend other tasks before executing more events
+        self._handle = self._aioloop.call_soon(self._step)
+
+    async def run(self):
+        # Executes the events in the running asyncio loop, until the eventloop finishes
+        self._thread_id = threading.current_thread().ident
+        self._finished = self._aioloop.create_future()
+        self._step()
+        try:
+            await self._finished
+        finally:
+            if self._handle is not None:
+                self._handle.cancel()
+                self._handle = None
+            self._finished = None
+
+    def loop(self):
+        self._aioloop.run_until_complete(self.run())
@@ -0,0 +1,36 @@
+# coding: utf-8
+#
+# CLUES Python utils - Utils and General classes that spin off from CLUES
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# The tests import the modules from the package cpyutils (as the modules use relative imports), so this
+#   module loads the root of the repository as that package, whether it is installed or not.
+
+import os
+import sys
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+try:
+    import importlib.util
+    _spec = importlib.util.spec_from_file_location("cpyutils", os.path.join(_ROOT, "__init__.py"), submodule_search_locations = [ _ROOT ])
+    cpyutils = importlib.util.module_from_spec(_spec)
+    sys.modules["cpyutils"] = cpyutils
+    _spec.loader.exec_module(cpyutils)
+except ImportError:
+    import imp
+    cpyutils = imp.load_module("cpyutils", None, _ROOT, ("", "", imp.PKG_DIRECTORY))
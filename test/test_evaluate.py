@@ -0,0 +1,194 @@
+# coding: utf-8
+#
+# CLUES Python utils - Utils and General classes that spin off from CLUES
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import random
+import unittest
+
+from context import cpyutils
+from cpyutils import evaluate
+
+EXPRESSIONS = [ 'ncpus >= 4 && physmem > 8000000', '"ops" in queues', 'queues subset ["all.q", "ops"]', 'not (ncpus * 2 - 1 < 4 / 2)',
+                'hostname == "all.q" || state != "free"', 'x = 3; x + ncpus', 'queues + [1]', 'state + "!"', 'undefined == 0', '-loadave',
+                'hostname > "a"', 'ncpus / 0', '7 / 2', 'state == 1', '[1, [2]] subset [[2], 1]', '1 in 2', '[1] subset state', '3 && 4', 'idletime or 1', '' ]
+
+HOSTS = [ { 'queues': evaluate.TypedList([ evaluate.TypedClass.auto("all.q") ]), 'hostname': evaluate.TypedClass.auto("vnode10.localdomain") },
+          evaluate.vars_from_string('ncpus=4;physmem=3922492;queues=[all.q,ops];loadave=0.00;state=free'),
+          evaluate.vars_from_string('ncpus="x";physmem=16000000;queues=[ops];state=busy;hostname="a"'),
+          {} ]
+
+def _result(compiled, _vars, autodefine):
+    # Returns the type and value of the result of the evaluation, or the type of the exception raised
+    try:
+        v = compiled.evaluate(dict(_vars), autodefine)
+    except Exception as e:
+        return type(e)
+    if v is None:
+        return None
+    return (v.type, v.get())
+
+def _matches(compiled, _vars, autodefine):
+    # Whether the host fulfils the expression (the hosts for which the evaluation fails do not)
+    try:
+        return evaluate._is_true(compiled.evaluate(dict(_vars), autodefine))
+    except Exception:
+        return False
+
+class TestNative(unittest.TestCase):
+    def assertSameResults(self, compiled):
+        native = compiled.native()
+        for autodefine in [ True, False ]:
+            for _vars in HOSTS:
+                self.assertEqual(_result(compiled, _vars, autodefine), _result(native, _vars, autodefine), "native code differs for '%s' with %s" % (compiled, _vars))
+
+    def test_expressions(self):
+        for expr in EXPRESSIONS:
+            self.assertSameResults(evaluate.compile_expression(expr))
+
+    def test_lazy_expressions(self):
+        for expr in [ 'ncpus >= 4 && physmem > 8000000 && state == "free"', 'state == "busy" || ncpus > 2 || "ops" in queues', 'undefined && ncpus > 1' ]:
+            for reorder in [ True, False ]:
+                self.assertSameResults(evaluate.compile_expression(expr).lazy(reorder))
+
+    def test_lazy_errors(self):
+        # An operand that raises an error does not decide the result, whatever the order of evaluation
+        hosts = [ evaluate.vars_from_string('state=busy;ncpus=%d' % (i % 8)) for i in range(5000) ]
+        host = evaluate.vars_from_string('state=free;ncpus="x"')
+        for reorder in [ True, False ]:
+            compiled = evaluate.compile_expression('state == "free" || ncpus > 2').lazy(reorder)
+            list(compiled.evaluate_many(hosts))
+            self.assertEqual(_result(compiled, host, True), (evaluate.TypedClass.BOOLEAN, True))
+            self.assertEqual(_result(compiled, evaluate.vars_from_string('state=busy;ncpus="x"'), True), TypeError)
+            self.assertSameResults(compiled)
+
+    def test_long_chains(self):
+        # The native code of long chains of operators must not nest one block per operand
+        for op in [ '||', '&&' ]:
+            expr = (" %s " % op).join([ 'hostname == "h%d"' % i for i in range(120) ])
+            self.assertSameResults(evaluate.compile_expression(expr).lazy())
+
+class TestPartial(unittest.TestCase):
+    def test_fixed_vars(self):
+        # Evaluating the partial expression must be the same than evaluating the expression with the fixed vars
+        for expr in [ '"a" in queues', 'queues subset ["a"]', 'x + 1', 'x == 0' ]:
+            for fixed_value in [ evaluate.TypedClass.auto("a"), evaluate.TypedList([ evaluate.TypedClass.auto("a") ]), evaluate.TypedClass(None, evaluate.TypedClass.UNKNOWN) ]:
+                for autodefine in [ True, False ]:
+                    name = 'queues' if 'queues' in expr else 'x'
+                    host = { 'queues': evaluate.TypedList([ evaluate.TypedClass.auto("a") ]), 'x': evaluate.TypedClass.auto(3) }
+                    merged = dict(host)
+                    merged[name] = evaluate.TypedClass(fixed_value.value, fixed_value.type)
+                    compiled = evaluate.compile_expression(expr)
+                    partial = compiled.partial({ name: evaluate.TypedClass(fixed_value.value, fixed_value.type) }, autodefine)
+                    self.assertEqual(_result(compiled, merged, autodefine), _result(partial, host, autodefine), "partial differs for '%s' with %s" % (expr, fixed_value))
+
+class TestEmptyLists(unittest.TestCase):
+    def test_lists_are_not_shared(self):
+        # The empty lists that are defined on the fly or returned are visible by the caller, so modifying them
+        #   must not change other evaluations
+        analyzer = evaluate.Analyzer()
+        analyzer.check('"x" in q')
+        analyzer.get_vars()['q'].value.append(evaluate.TypedClass.auto('x'))
+        for native in [ False, True ]:
+            compiled = evaluate.compile_expression('[]')
+            if native:
+                compiled = compiled.native()
+            compiled.evaluate({}).value.append(evaluate.TypedClass.auto('x'))
+            self.assertEqual(_result(compiled, {}, True), (evaluate.TypedClass.LIST, []))
+            self.assertEqual(_result(evaluate.compile_expression('"x" in []'), {}, True), (evaluate.TypedClass.BOOLEAN, False))
+            self.assertEqual(_result(evaluate.compile_expression('"x" in q').native(), {}, True), (evaluate.TypedClass.BOOLEAN, False))
+
+class TestProfiler(unittest.TestCase):
+    def test_stats_by_expression(self):
+        # The stats of an expression are kept together even if it is compiled again each time
+        cache = evaluate.get_expression_cache()
+        evaluate.set_expression_cache(None)
+        evaluate.enable_profiling()
+        try:
+            for _ in range(10):
+                evaluate.evaluate(' ncpus > 2', { 'ncpus': evaluate.TypedClass.auto(4) })
+            compiled = evaluate.compile_expression('ncpus > 2')
+            compiled.lazy().evaluate({})
+            stats = evaluate.get_stats()
+            self.assertEqual(sorted([ d["evaluations"] for d in stats ]), [ 1, 10 ])
+            self.assertTrue("evaluations: 10 " in evaluate.explain('ncpus > 2'))
+        finally:
+            evaluate.disable_profiling()
+            evaluate.set_expression_cache(cache)
+
+class TestIncremental(unittest.TestCase):
+    def test_removed_hosts(self):
+        # The results of the hosts that are removed from the store are forgotten
+        store = evaluate.HostStateStore()
+        evaluator = evaluate.IncrementalEvaluator(store)
+        compiled = evaluate.compile_expression('ncpus > 2')
+        for cycle in range(10):
+            store.update_host("host%d" % cycle, evaluate.vars_from_string('ncpus=%d' % cycle))
+            if cycle > 0:
+                store.remove_host("host%d" % (cycle - 1))
+            self.assertEqual(evaluator.match(compiled), [ "host%d" % cycle ] if cycle > 2 else [])
+            self.assertEqual(len(evaluator._results[compiled]), 1)
+
+class TestHostIndex(unittest.TestCase):
+    EXPRESSIONS = [ 'hostname == "h3"', 'state == ""', 'ncpus == 0', 'ncpus == 2', 'enabled == false', '"q1" in queues', '"" in queues',
+                    'queues subset ["q1", "q2"]', 'queues subset []', 'state == "free" && "q2" in queues', 'state == "busy" || ncpus == 4',
+                    'hostname == "h1" || hostname == "h2" || "q3" in queues', 'ncpus == 2 && state == "free" && queues subset ["q0", "q1", "q2"]',
+                    '(state == "free" || ncpus == 0) && "q1" in queues', 'ncpus > 2 && state == "free"', 'state == "free" && false' ]
+
+    def random_hosts(self, n):
+        # Hosts with missing keywords, empty lists and values that cannot be indexed
+        r = random.Random(0)
+        hosts = []
+        for i in range(n):
+            _vars = { 'hostname': evaluate.TypedClass.auto("h%d" % i) }
+            if r.random() < 0.8:
+                _vars['state'] = evaluate.TypedClass.auto(r.choice([ "free", "busy", "" ]))
+            if r.random() < 0.8:
+                _vars['ncpus'] = evaluate.TypedClass.auto(r.choice([ 0, 2, 4, "x" ]))
+            if r.random() < 0.5:
+                _vars['enabled'] = evaluate.TypedClass(r.random() < 0.5, evaluate.TypedClass.BOOLEAN)
+            if r.random() < 0.8:
+                queues = [ evaluate.TypedClass.auto(q) for q in r.sample([ "q0", "q1", "q2", "q3", "" ], r.randint(0, 3)) ]
+                if r.random() < 0.1:
+                    queues.append(evaluate.TypedList([]))
+                _vars['queues'] = evaluate.TypedList(queues)
+            elif r.random() < 0.3:
+                _vars['queues'] = evaluate.TypedClass.auto("q1")
+            hosts.append(("host%d" % i, _vars))
+        return hosts
+
+    def test_match(self):
+        # The hosts that match using the index must be the same than evaluating the expression for every host
+        hosts = self.random_hosts(300)
+        index = evaluate.HostIndex()
+        for (host, _vars) in hosts + self.random_hosts(100)[::-1]:
+            index.add_host(host, _vars)
+        for (host, _vars) in hosts[:100]:
+            index.add_host(host, _vars)
+        for (host, _) in hosts[250:]:
+            index.remove_host(host)
+        hosts = hosts[:250]
+        for expr in self.EXPRESSIONS:
+            for autodefine in [ True, False ]:
+                compiled = evaluate.compile_expression(expr)
+                for variant in [ compiled, compiled.lazy(), compiled.lazy().native() ]:
+                    expected = [ host for (host, _vars) in hosts if _matches(variant, _vars, autodefine) ]
+                    self.assertEqual(sorted(index.match(variant, autodefine)), sorted(expected), "index differs for '%s' (autodefine %s)" % (expr, autodefine))
+        self.assertNotEqual(index.candidates(evaluate.compile_expression('"q1" in queues')), None)
+
+if __name__ == '__main__':
+    unittest.main()
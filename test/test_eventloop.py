@@ -0,0 +1,197 @@
+# coding: utf-8
+#
+# CLUES Python utils - Utils and General classes that spin off from CLUES
+# Copyright (C) 2015 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import random
+import unittest
+from concurrent.futures import Future
+
+from context import cpyutils
+from cpyutils import eventloop
+
+LOOPS = [ eventloop._EventLoop, eventloop._EventLoop_Simulation, eventloop._EventLoop_TimingWheel ]
+
+class TestReprogram(unittest.TestCase):
+    def run_events(self, loop_class, reprogram_at, reprogram_to):
+        # Runs an event at 100 that is reprogrammed by other event, together with an event at 50
+        loop = loop_class()
+        loop.set_endless_loop(False)
+        executed = []
+        ev = loop.add_event(eventloop.Event(100, callback = lambda: executed.append(('ev', loop.time()))))
+        loop.add_event(eventloop.Event(50, callback = lambda: executed.append(('other', loop.time()))))
+        loop.add_event(eventloop.Event(reprogram_at, callback = lambda: ev.reprogram(reprogram_to)))
+        loop.loop()
+        return executed
+
+    def test_reprogram_earlier(self):
+        for loop_class in LOOPS:
+            self.assertEqual(self.run_events(loop_class, 1, 10), [ ('ev', 10), ('other', 50) ], loop_class.__name__)
+
+    def test_reprogram_later(self):
+        for loop_class in LOOPS:
+            self.assertEqual(self.run_events(loop_class, 1, 200), [ ('other', 50), ('ev', 200) ], loop_class.__name__)
+
+    def test_changed_to_past(self):
+        # An event whose time is changed to the past (without reprogramming it) is executed when it is
+        #   found in the queue, and the time of the eventloop never goes back
+        for loop_class in LOOPS:
+            loop = loop_class()
+            loop.set_endless_loop(False)
+            executed = []
+            ev = loop.add_event(eventloop.Event(100, callback = lambda: executed.append(('ev', loop.time()))))
+            loop.add_event(eventloop.Event(50, callback = lambda: executed.append(('other', loop.time()))))
+            loop.add_event(eventloop.Event(1, callback = lambda: setattr(ev, 't', 0)))
+            loop.loop()
+            self.assertEqual(executed, [ ('other', 50), ('ev', 50) ], loop_class.__name__)
+            self.assertEqual(loop.time(), 50, loop_class.__name__)
+
+class TestTimingWheel(unittest.TestCase):
+    def pop_valid(self, scheduler, valid):
+        # Pops the next entry that has not been discarded (the discarded ones may be removed lazily)
+        while True:
+            entry = scheduler.peek()
+            if entry is None:
+                return None
+            scheduler.pop()
+            if valid.get(entry[3]) is entry:
+                del valid[entry[3]]
+                return entry
+
+    def test_same_order_than_heap(self):
+        # A small wheel with a coarse tick makes the entries cascade between levels and go to the overflow bucket
+        r = random.Random(0)
+        heap = eventloop._EventHeap()
+        wheel = eventloop._TimingWheel(tick = 1, bits = 2, levels = 2)
+        valid = {}
+        now = 0
+        for seq in range(3000):
+            action = r.random()
+            if action < 0.5:
+                entry = (now + r.choice([ 0, r.random() * 3, r.random() * 20, r.random() * 200 ]), r.randint(0, 3), seq, seq % 500)
+                if entry[3] in valid:
+                    heap.discard(valid[entry[3]])
+                    wheel.discard(valid[entry[3]])
+                valid[entry[3]] = entry
+                heap.push(entry)
+                wheel.push(entry)
+            elif action < 0.6 and len(valid) > 0:
+                entry = valid.pop(r.choice(list(valid.keys())))
+                heap.discard(entry)
+                wheel.discard(entry)
+            else:
+                expected = self.pop_valid(heap, dict(valid))
+                entry = self.pop_valid(wheel, valid)
+                self.assertEqual(entry, expected)
+                if entry is not None:
+                    now = entry[0]
+        while len(valid) > 0:
+            expected = self.pop_valid(heap, dict(valid))
+            self.assertEqual(self.pop_valid(wheel, valid), expected)
+
+    def run_events(self, eventloop_instance):
+        # Runs periodical and one-shot events (some of them far in the future) that cancel other events
+        r = random.Random(0)
+        loop = eventloop_instance
+        loop.set_endless_loop(False)
+        loop.limit_walltime(2000)
+        executed = []
+        ids = []
+        def callback(name):
+            executed.append((name, loop.time()))
+            if r.random() < 0.3 and len(ids) > 0:
+                loop.cancel_event(ids.pop(r.randrange(len(ids))))
+            if r.random() < 0.5:
+                ids.append(loop.add_event(eventloop.Event(r.choice([ 0, 0.5, r.random() * 10, r.random() * 500 ]), callback = callback, parameters = [ "e%d" % len(executed) ], mute = True)).id)
+        for i in range(20):
+            loop.add_event(eventloop.Event_Periodical(r.random() * 10, r.choice([ 1, 3.5, 17, 60 ]), callback = callback, parameters = [ "p%d" % i ], mute = True))
+        for i in range(50):
+            ids.append(loop.add_event(eventloop.Event(r.random() * 1500, callback = callback, parameters = [ "o%d" % i ], mute = True)).id)
+        loop.loop()
+        return executed
+
+    def test_same_events_than_heap(self):
+        expected = self.run_events(eventloop._EventLoop())
+        self.assertEqual(self.run_events(eventloop._EventLoop_TimingWheel(tick = 1, bits = 2, levels = 2)), expected)
+
+class Counter(object):
+    def __init__(self):
+        self.count = 0
+
+    def increase(self):
+        self.count += 1
+
+class TestSnapshot(unittest.TestCase):
+    def test_bound_method(self):
+        # The callbacks can be bound methods, that are different objects each time that they are accessed
+        counter = Counter()
+        eventloop.register_callback("increase", counter.increase)
+        try:
+            loop = eventloop._EventLoop_Simulation()
+            loop.set_endless_loop(False)
+            loop.add_event(eventloop.Event(10, callback = counter.increase))
+            state = loop.snapshot()
+            restored = eventloop._EventLoop_Simulation()
+            restored.set_endless_loop(False)
+            restored.restore(state)
+            restored.loop()
+            self.assertEqual(counter.count, 1)
+        finally:
+            eventloop.unregister_callback("increase")
+
+class _LoggedLoop(eventloop._EventLoop_Simulation):
+    # Eventloop that counts the times that the metrics are logged and whose threaded callbacks finish
+    #   before the eventloop checks them
+    def __init__(self):
+        eventloop._EventLoop_Simulation.__init__(self)
+        self.logged = []
+
+    def _log_metrics(self):
+        self.logged.append(self.time())
+
+    def _run_in_thread(self, callback, parameters):
+        future = Future()
+        future.set_result(callback(*parameters))
+        return future
+
+class TestMetrics(unittest.TestCase):
+    def test_log_period(self):
+        # Logging the metrics must not keep the eventloop running nor alter the snapshots
+        loop = _LoggedLoop()
+        loop.set_endless_loop(False)
+        loop.enable_metrics(2)
+        for t in [ 1, 3, 5 ]:
+            loop.add_event(eventloop.Event_Simple(t, "event at %d" % t))
+        loop.snapshot()
+        loop.loop()
+        self.assertEqual(loop.time(), 5)
+        self.assertEqual(loop.logged, [ 3, 5 ])
+        self.assertEqual(loop.get_metrics()["dispatched"], 3)
+
+    def test_finished_callbacks(self):
+        # The threaded callbacks that have finished when the eventloop checks them are counted as executed
+        loop = _LoggedLoop()
+        loop.set_endless_loop(False)
+        loop.enable_metrics()
+        loop.add_event(eventloop.Event(1, callback = lambda: None, description = "threaded", threaded_callback = True))
+        loop.loop()
+        metrics = loop.get_metrics()
+        self.assertEqual(metrics["callbacks"]["threaded"]["calls"], 1)
+        self.assertEqual(metrics["in_flight"], 0)
+
+if __name__ == '__main__':
+    unittest.main()